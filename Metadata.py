@@ -12,33 +12,55 @@ metadata.py — 基于 PyMuPDF get_text("words") 的作者切分与排序（修
 对外接口保持：
 - extract_first_page(pdf_path) → tuple[PaperMeta, int]
 - extract_first_page_llm(pdf_path) → tuple[PaperMeta, int] (async)
+- extract_many(pdf_paths) → list[tuple[PaperMeta, int]] (async，多文件并发，可合并LLM请求)
+- extract_first_page_batch(pdf_paths) → list[tuple[PaperMeta, int]] (同步，多文件并发)
 - fix_author_order_precise(authors, pdf_path) 内部改用行聚类+行内排序。
 """
 
 import os
 import re
+import copy
 import json
-import difflib
+import atexit
+import heapq
+import hashlib
 import asyncio
+import threading
+import weakref
+import multiprocessing
 import aiohttp
-from statistics import median
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from functools import lru_cache
 from dataclasses import dataclass, asdict
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Union
 
+import numpy as np
+import orjson
 import pymupdf as fitz
 import regex as reg
+from rapidfuzz import fuzz, process
+from scipy.optimize import linear_sum_assignment
 from config import Config
 
 # =========================
 # 工具
 # =========================
 
+_WS_RE = re.compile(r"[ \t]+")
+_TAIL_DIGITS_RE = re.compile(r"\d+\s*$")
+_ALL_WS_RE = re.compile(r"\s+")
+
+
 def norm(s: str) -> str:
-    return re.sub(r"[ \t]+", " ", s.strip())
+    return _WS_RE.sub(" ", s.strip())
 
 
 def join_lines(lines: List[str]) -> str:
-    return norm(" ".join([l.strip() for l in lines if l and l.strip()]))
+    # 每行只 strip 一次；拼接结果首尾已无空白，直接压缩行内空白即可
+    return _WS_RE.sub(" ", " ".join(filter(None, map(str.strip, filter(None, lines)))))
 
 
 EMDASH = "\u2014"  # —
@@ -47,14 +69,14 @@ EMDASH = "\u2014"  # —
 # 数据结构
 # =========================
 
-@dataclass
+@dataclass(slots=True)
 class Affiliation:
     id: str
     name: str
     raw: str
 
 
-@dataclass
+@dataclass(slots=True)
 class Author:
     order: int
     name: str
@@ -65,7 +87,7 @@ class Author:
     is_corresponding_author: bool = False
 
 
-@dataclass
+@dataclass(slots=True)
 class PaperMeta:
     title: str
     abstract: Optional[str]
@@ -76,6 +98,186 @@ class PaperMeta:
     confidence: float
 
 
+def _empty_meta() -> PaperMeta:
+    """提取失败时返回的空结果；每次新建，列表字段与正常结果一致，调用方可以原地修改"""
+    return PaperMeta(title="", abstract=None, keywords=[], authors=[], affiliations=[], emails=[], confidence=0.0)
+
+
+@dataclass(slots=True)
+class _PageCtx:
+    """单次打开PDF后缓存的内容：LLM输入文本 + 第一页 words（仅作者重排序需要）"""
+    page0_text: str
+    page0_words: Optional[List[tuple]] = None
+    page0_height: float = 0.0
+
+
+# =========================
+# 结果缓存（按文件内容哈希 + 模式）
+# =========================
+
+# 相同内容的PDF（包括重名上传、重试）直接复用结果，不再解析和调用LLM
+_META_CACHE: "OrderedDict[Tuple[str, str], Tuple[PaperMeta, int]]" = OrderedDict()
+# 页面解析结果单独缓存，LLM失败重试时无需重新解析PDF
+_CTX_CACHE: "OrderedDict[Tuple[str, str], _PageCtx]" = OrderedDict()
+_CTX_CACHE_SIZE = 64
+# LLM结果按“归一化文本 + 模式”缓存：字节不同但文本相同的PDF（重新导出、改了元信息）也能命中
+_LLM_CACHE: "OrderedDict[Tuple[str, str], dict]" = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+
+
+def _file_digest(path: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _text_digest(text: str) -> str:
+    return hashlib.blake2b(_ALL_WS_RE.sub(" ", text).strip().encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _cache_get(cache: OrderedDict, key):
+    with _CACHE_LOCK:
+        v = cache.get(key)
+        if v is not None:
+            cache.move_to_end(key)
+        return v
+
+
+def _cache_put(cache: OrderedDict, key, value, maxsize: int):
+    with _CACHE_LOCK:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > maxsize:
+            cache.popitem(last=False)
+
+
+# 持久化结果缓存：进程重启后仍能复用已提取的结果。
+# JSON Lines 追加写，每行 {"k": "摘要:模式:版本", "v": PaperMeta字典, "t": tokens}，同一 key 以后写的为准；
+# 首次使用时整体读入内存。内存中只保留最近 META_CACHE_FILE_SIZE 条，
+# 文件行数超过保留条数的两倍（或加载时有重复/过期行）时压缩重写。
+_DISK_CACHE: Optional["OrderedDict[str, tuple]"] = None
+_DISK_CACHE_LINES = 0  # 缓存文件当前行数（含已被覆盖或淘汰的旧行）
+_DISK_CACHE_LOCK = threading.Lock()
+# 结果后处理（_build_meta）或 PaperMeta 结构变化时递增，使旧的持久化记录失效
+_DISK_CACHE_SCHEMA = 1
+
+
+@lru_cache(maxsize=None)
+def _disk_cache_version(mode: str) -> str:
+    """持久化缓存 key 的版本部分：模型名 + 该模式提示词 + 结果结构版本，任一变化都不再命中旧记录"""
+    h = hashlib.blake2b(digest_size=8)
+    for part in (Config.LLM_MODEL, *PromptsConfig.get_prompt_parts(mode), str(_DISK_CACHE_SCHEMA)):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _disk_cache_key(key: Tuple[str, str]) -> str:
+    return f"{key[0]}:{key[1]}:{_disk_cache_version(key[1])}"
+
+
+def _meta_from_dict(d: Dict[str, Any]) -> PaperMeta:
+    return PaperMeta(
+        title=d.get("title") or "",
+        abstract=d.get("abstract"),
+        keywords=list(d.get("keywords") or []),
+        authors=[Author(**a) for a in d.get("authors") or []],
+        affiliations=[Affiliation(**a) for a in d.get("affiliations") or []],
+        emails=list(d.get("emails") or []),
+        confidence=d.get("confidence") or 0.0,
+    )
+
+
+def _rewrite_disk_cache(path: str, entries: "OrderedDict[str, tuple]"):
+    """按内存中的条目重写缓存文件（调用方需持有 _DISK_CACHE_LOCK）"""
+    global _DISK_CACHE_LINES
+    try:
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            for k, (v, t) in entries.items():
+                f.write(orjson.dumps({"k": k, "v": v, "t": t}) + b"\n")
+        os.replace(tmp, path)
+        _DISK_CACHE_LINES = len(entries)
+    except OSError as e:
+        print("压缩结果缓存文件失败:", e)
+
+
+def _load_disk_cache() -> "OrderedDict[str, tuple]":
+    """读入持久化缓存（调用方需持有 _DISK_CACHE_LOCK）"""
+    global _DISK_CACHE, _DISK_CACHE_LINES
+    if _DISK_CACHE is not None:
+        return _DISK_CACHE
+    entries: "OrderedDict[str, tuple]" = OrderedDict()
+    path = Config.META_CACHE_FILE
+    lines = 0
+    if path and os.path.exists(path):
+        try:
+            with open(path, "rb") as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        rec = orjson.loads(line)
+                        entries[rec["k"]] = (rec["v"], rec.get("t", 0))
+                        entries.move_to_end(rec["k"])
+                    except (orjson.JSONDecodeError, KeyError, TypeError):
+                        continue
+        except OSError as e:
+            print("读取结果缓存文件失败:", e)
+        while len(entries) > Config.META_CACHE_FILE_SIZE:
+            entries.popitem(last=False)
+        _DISK_CACHE_LINES = lines
+        if lines > len(entries):
+            _rewrite_disk_cache(path, entries)
+    _DISK_CACHE = entries
+    return entries
+
+
+def _disk_cache_get(key: Tuple[str, str]) -> Optional[Tuple[PaperMeta, int]]:
+    if not Config.META_CACHE_FILE:
+        return None
+    k = _disk_cache_key(key)
+    with _DISK_CACHE_LOCK:
+        entries = _load_disk_cache()
+        hit = entries.get(k)
+        if hit is not None:
+            entries.move_to_end(k)
+    if hit is None:
+        return None
+    try:
+        return _meta_from_dict(hit[0]), hit[1]
+    except TypeError:
+        # 字段结构与当前版本不一致的旧记录视为未命中
+        return None
+
+
+def _disk_cache_put(key: Tuple[str, str], meta: PaperMeta, tokens_used: int):
+    global _DISK_CACHE_LINES
+    path = Config.META_CACHE_FILE
+    if not path:
+        return
+    k = _disk_cache_key(key)
+    v = asdict(meta)
+    with _DISK_CACHE_LOCK:
+        entries = _load_disk_cache()
+        entries[k] = (v, tokens_used)
+        entries.move_to_end(k)
+        while len(entries) > Config.META_CACHE_FILE_SIZE:
+            entries.popitem(last=False)
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "ab") as f:
+                f.write(orjson.dumps({"k": k, "v": v, "t": tokens_used}) + b"\n")
+            _DISK_CACHE_LINES += 1
+        except OSError as e:
+            print("写入结果缓存文件失败:", e)
+            return
+        # 追加的旧行（被覆盖或已淘汰）累积过多时压缩重写，文件大小保持有界
+        if _DISK_CACHE_LINES > 2 * max(Config.META_CACHE_FILE_SIZE, 1):
+            _rewrite_disk_cache(path, entries)
+
+
 # =========================
 # LLM API
 # =========================
@@ -88,125 +290,460 @@ API_ENDPOINT = Config.LLM_API_ENDPOINT
 from prompts_config import PromptsConfig
 
 
-async def call_llm_api(text_content: str, mode: str = 'sn') -> tuple[dict, int]:
+# 全局复用的HTTP会话（连接池 + keep-alive），只挂在 run_sync 的常驻事件循环上：服务内所有请求都在该循环上执行，
+# 共用同一个会话。脚本直接用 asyncio.run 调用时，循环结束后已无法再关闭挂在其上的会话（连接会泄漏），
+# 因此其它循环上每次调用临时建会话并在返回前关闭；extract_many 为整批只建一个会话并传给各篇。
+_SESSION: Optional[aiohttp.ClientSession] = None
+
+
+def _new_session() -> aiohttp.ClientSession:
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=Config.LLM_MAX_CONNECTIONS,
+                                       limit_per_host=Config.LLM_MAX_CONNECTIONS,
+                                       ttl_dns_cache=300, keepalive_timeout=60),
+        timeout=aiohttp.ClientTimeout(total=60),
+    )
+
+
+async def _get_session() -> aiohttp.ClientSession:
+    """常驻事件循环上的共享会话，首次使用时创建（只在该循环上调用，无需加锁）"""
+    global _SESSION
+    if _SESSION is None or _SESSION.closed:
+        _SESSION = _new_session()
+    return _SESSION
+
+
+@asynccontextmanager
+async def _session_scope(session: Optional[aiohttp.ClientSession] = None):
+    """调用方传入的会话原样使用；常驻循环上用共享会话；其它循环上临时建会话，退出时关闭"""
+    if session is not None:
+        yield session
+    elif asyncio.get_running_loop() is _BG_LOOP:
+        yield await _get_session()
+    else:
+        async with _new_session() as tmp:
+            yield tmp
+
+
+async def close_session():
+    """关闭常驻事件循环上的共享HTTP会话（需在该循环上调用，其它循环上的临时会话已随调用关闭）"""
+    global _SESSION
+    if asyncio.get_running_loop() is not _BG_LOOP:
+        return
+    session, _SESSION = _SESSION, None
+    if session is not None and not session.closed:
+        await session.close()
+
+
+@atexit.register
+def _close_session_at_exit():
+    loop = _BG_LOOP
+    if _SESSION is None or _SESSION.closed or loop is None or loop.is_closed():
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(close_session(), loop).result(timeout=5)
+    except Exception:
+        pass
+
+
+def _clip_input(text: str) -> str:
+    """按字符预算截断输入文本：元数据集中在页首，超长部分只增加耗时与 tokens"""
+    limit = Config.LLM_MAX_INPUT_CHARS
+    return text[:limit] if limit > 0 else text
+
+
+def _llm_request(content: str, max_tokens: int) -> tuple[dict, dict]:
     headers = {"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"}
     payload = {
         "model": Config.LLM_MODEL,
-        "max_tokens": Config.LLM_MAX_TOKENS,
+        "max_tokens": max_tokens,
         "temperature": Config.LLM_TEMPERATURE,
-        "messages": [{"role": "user", "content": PromptsConfig.get_prompt_for_mode(mode).format(text_content=text_content)}],
+        "messages": [{"role": "user", "content": content}],
     }
+    return payload, headers
+
+
+async def call_llm_api(text_content: str, mode: str = 'sn',
+                       session: Optional[aiohttp.ClientSession] = None) -> tuple[dict, int]:
+    prefix, suffix = PromptsConfig.get_prompt_parts(mode)
+    payload, headers = _llm_request(prefix + _clip_input(text_content) + suffix, Config.LLM_MAX_TOKENS)
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(API_ENDPOINT, json=payload, headers=headers, timeout=60) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    content = data["choices"][0]["message"]["content"]
-                    i, j = content.find("{"), content.rfind("}")
-                    if i != -1 and j != -1:
-                        result = json.loads(content[i:j+1])
-                        # 获取tokens使用量
-                        usage = data.get("usage", {})
-                        tokens_used = usage.get("total_tokens", 0)
-                        return result, tokens_used
-                    raise ValueError("LLM返回缺少有效JSON")
-                else:
-                    raise RuntimeError(f"API {resp.status}: {await resp.text()}")
+        async with _session_scope(session) as s:
+            return await _post_llm(s, payload, headers)
     except Exception as e:
         print("LLM API调用失败:", e)
         return None, 0
 
 
+_BATCH_INSTRUCTION = (
+    "\n\n以上共 {n} 篇论文，每篇以“=== 文档 k ===”开头。请对每一篇分别按上述JSON格式提取，"
+    "并输出 {{\"results\": [文档1的JSON, 文档2的JSON, ...]}}，数组顺序与文档编号一致，不要输出其他内容。"
+)
+
+
+def _llm_batch_limit(batch_size: int) -> int:
+    """每次合并的篇数上限：篇数 × 单篇输出预算不超过模型输出上限，否则结果会被截断"""
+    return max(1, min(batch_size, Config.LLM_MAX_OUTPUT_TOKENS // max(Config.LLM_MAX_TOKENS, 1)))
+
+
+async def call_llm_api_batch(texts: List[str], mode: str = 'sn',
+                             session: Optional[aiohttp.ClientSession] = None) -> tuple[List[Optional[dict]], int]:
+    """
+    多篇第一页文本合并为一次LLM请求，分摊固定提示词与请求开销。
+    返回与 texts 等长的结果列表；数量对不上或请求失败时对应位置为 None，由调用方逐篇重试。
+    """
+    prefix, suffix = PromptsConfig.get_prompt_parts(mode)
+    docs = "\n\n".join(f"=== 文档 {k} ===\n{_clip_input(t)}" for k, t in enumerate(texts, 1))
+    # 输出预算按篇数放大，但不能超过模型的输出上限，否则请求会被直接拒绝
+    max_tokens = min(Config.LLM_MAX_TOKENS * len(texts), Config.LLM_MAX_OUTPUT_TOKENS)
+    payload, headers = _llm_request(prefix + docs + suffix + _BATCH_INSTRUCTION.format(n=len(texts)), max_tokens)
+    try:
+        async with _session_scope(session) as s:
+            result, tokens_used = await _post_llm(s, payload, headers)
+    except Exception as e:
+        print("LLM API批量调用失败:", e)
+        return [None] * len(texts), 0
+    items = result.get("results") if isinstance(result, dict) else None
+    if not isinstance(items, list) or len(items) != len(texts):
+        print("LLM批量结果数量不符，改为逐篇请求")
+        return [None] * len(texts), tokens_used
+    return [it if isinstance(it, dict) and it else None for it in items], tokens_used
+
+
+def _split_tokens(total: int, ok_flags: List[bool]) -> List[int]:
+    """把一次批量请求的 tokens 分摊到各篇：成功的篇目均摊，余数记在第一篇成功的；全部失败时记在第一篇，总数不变"""
+    ok = [i for i, flag in enumerate(ok_flags) if flag] or [0]
+    share, rest = divmod(total, len(ok))
+    out = [0] * len(ok_flags)
+    for k, i in enumerate(ok):
+        out[i] = share + (rest if k == 0 else 0)
+    return out
+
+
+class _LLMBatcher:
+    """
+    请求合并器：同一事件循环上、同一模式在 wait 秒内先后到达的单篇LLM请求，
+    凑满 size 篇或时间窗结束时合并成一次 call_llm_api_batch 发送。
+    每篇拿到 (结果或None, 分摊的tokens)；None 表示批量结果不可用（含时间窗内只有一篇），由调用方逐篇请求。
+    """
+
+    def __init__(self, mode: str, size: int, wait: float):
+        self.mode = mode
+        self.size = size
+        self.wait = wait
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()  # 持有发送任务的引用，防止被垃圾回收
+
+    async def submit(self, text: str) -> tuple[Optional[dict], int]:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((text, fut))
+        if len(self._pending) >= self.size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.wait, self._flush)
+        return await fut
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # 等待期间已被取消的请求不再发送
+        batch = [(text, fut) for text, fut in self._pending if not fut.done()]
+        self._pending = []
+        if len(batch) == 1:
+            batch[0][1].set_result((None, 0))
+        elif batch:
+            task = asyncio.ensure_future(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: List[Tuple[str, asyncio.Future]]):
+        results: List[Optional[dict]] = [None] * len(batch)
+        tokens_used = 0
+        try:
+            results, tokens_used = await call_llm_api_batch([text for text, _ in batch], self.mode)
+        finally:
+            # 无论成功、失败还是被取消，都要让每个等待者拿到结果
+            shares = _split_tokens(tokens_used, [bool(r) for r in results])
+            for (_, fut), r, t in zip(batch, results, shares):
+                if not fut.done():
+                    fut.set_result((r, t))
+
+
+_BATCHERS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, _LLMBatcher]]" = weakref.WeakKeyDictionary()
+_BATCHERS_LOCK = threading.Lock()
+
+
+def _get_batcher(mode: str) -> _LLMBatcher:
+    loop = asyncio.get_running_loop()
+    with _BATCHERS_LOCK:
+        per_loop = _BATCHERS.setdefault(loop, {})
+        batcher = per_loop.get(mode)
+        if batcher is None:
+            batcher = per_loop[mode] = _LLMBatcher(mode, _llm_batch_limit(Config.LLM_BATCH_SIZE),
+                                                   Config.LLM_BATCH_WAIT)
+    return batcher
+
+
+async def _call_llm(text_content: str, mode: str,
+                    session: Optional[aiohttp.ClientSession] = None) -> tuple[Optional[dict], int]:
+    """
+    单篇LLM请求。开启请求合并（LLM_BATCH_SIZE > 1）时先与同时到达的其它篇合并发送，
+    合并结果不可用时再逐篇请求，已消耗的批量 tokens 计入本篇。
+    """
+    if _llm_batch_limit(Config.LLM_BATCH_SIZE) <= 1:
+        return await call_llm_api(text_content, mode, session)
+    result, batch_tokens = await _get_batcher(mode).submit(text_content)
+    if result:
+        return result, batch_tokens
+    result, tokens_used = await call_llm_api(text_content, mode, session)
+    return result, (tokens_used or 0) + batch_tokens
+
+
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _parse_json_object(content: str) -> Optional[dict]:
+    """
+    从LLM回复中取出JSON对象。常见情况（首个 { 到最后一个 } 恰好是一个对象）直接用 orjson 解析；
+    失败时（如对象后面还有带 } 的说明文字）从每个 { 起用 raw_decode 找第一个完整对象。
+    """
+    i, j = content.find("{"), content.rfind("}")
+    if i == -1 or j == -1:
+        return None
+    try:
+        return orjson.loads(content[i:j+1])
+    except orjson.JSONDecodeError:
+        pass
+    while i != -1:
+        try:
+            obj, _ = _JSON_DECODER.raw_decode(content, i)
+            if isinstance(obj, dict):
+                return obj
+        except ValueError:
+            pass
+        i = content.find("{", i + 1)
+    return None
+
+
+async def _post_llm(session: aiohttp.ClientSession, payload: dict, headers: dict) -> tuple[dict, int]:
+    # orjson 序列化请求体：比 aiohttp 默认的 json.dumps 快，且中文按 UTF-8 原样输出，体积更小
+    async with session.post(API_ENDPOINT, data=orjson.dumps(payload), headers=headers) as resp:
+        if resp.status == 200:
+            data = orjson.loads(await resp.read())
+            content = data["choices"][0]["message"]["content"]
+            result = _parse_json_object(content)
+            if result is not None:
+                # 获取tokens使用量
+                usage = data.get("usage", {})
+                tokens_used = usage.get("total_tokens", 0)
+                return result, tokens_used
+            raise ValueError("LLM返回缺少有效JSON")
+        else:
+            raise RuntimeError(f"API {resp.status}: {await resp.text()}")
+
+
 # =========================
 # PDF 抽取
 # =========================
 
-def extract_text_from_pdf(pdf_path: str) -> str:
+@contextmanager
+def _as_doc(src: Union[str, fitz.Document]):
+    """传入路径时打开并在退出时关闭；传入已打开的 Document 时原样使用，由调用方负责关闭。"""
+    if isinstance(src, fitz.Document):
+        yield src
+        return
+    doc = fitz.open(src)
     try:
-        doc = fitz.open(pdf_path)
-        if len(doc) > 0:
-            text = doc[0].get_text("text")
-            doc.close()
-            return text
+        yield doc
+    finally:
         doc.close()
-        return ""
+
+
+def extract_text_from_pdf(pdf_path: Union[str, fitz.Document]) -> str:
+    try:
+        with _as_doc(pdf_path) as doc:
+            return _page0_text(doc)
     except Exception as e:
         print("PDF文本提取失败:", e)
         return ""
 
 
-def extract_text_with_span_info(pdf_path: str) -> str:
+def _page0_text(doc) -> str:
+    return doc[0].get_text("text") if len(doc) > 0 else ""
+
+
+def extract_text_with_span_info(pdf_path: Union[str, fitz.Document]) -> str:
     """
     提取PDF文本，同时保留span结构信息，用于更好地处理角标。
     AP模式下改为提取PDF的第1和第2页（如果存在第二页），合并后返回。
     """
     try:
-        doc = fitz.open(pdf_path)
-        if len(doc) == 0:
-            doc.close()
+        with _as_doc(pdf_path) as doc:
+            return _span_text(doc)
+    except Exception as e:
+        print("PDF span信息提取失败:", e)
+        # 回退：简单提取前两页文本
+        try:
+            with _as_doc(pdf_path) as fallback_doc:
+                return _plain_text_first_pages(fallback_doc)
+        except Exception as _:
             return ""
 
-        pages_to_read = min(2, len(doc))  # 读取前两页
-        text_parts = []
 
-        for page_index in range(pages_to_read):
-            page = doc[page_index]
-            blocks = page.get_text("dict").get("blocks", [])
+# 角标识别只用到文字span，不需要图片块（dict 模式默认会把图片二进制一起带出）
+_SPAN_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
 
-            for block in blocks:
-                if "lines" not in block:
-                    continue
 
-                for line in block["lines"]:
-                    line_text = ""
-                    spans = line.get("spans", [])
+def _span_text(doc) -> str:
+    if len(doc) == 0:
+        return ""
 
-                    for i, span in enumerate(spans):
-                        span_text = (span.get("text") or "").strip()
-                        if not span_text:
-                            continue
+    pages_to_read = min(2, len(doc))  # 读取前两页
+    text_parts = []
 
-                        font_size = span.get("size", 0)
+    for page_index in range(pages_to_read):
+        page = doc[page_index]
+        blocks = page.get_text("dict", flags=_SPAN_FLAGS).get("blocks", [])
 
-                        # 改进的角标识别逻辑
-                        is_superscript = _is_independent_superscript(span, spans, i, font_size)
+        for block in blocks:
+            if "lines" not in block:
+                continue
 
-                        if is_superscript:
-                            # 独立的角标，用特殊标记包围
-                            line_text += f" [SUPERSCRIPT:{span_text}] "
-                        else:
-                            # 正常文本或嵌入在姓名中的角标
-                            line_text += span_text + " "
+            for line in block["lines"]:
+                line_text = ""
+                spans = line.get("spans", [])
+                line_avg = _get_average_font_size(spans)  # 每行只算一次
 
-                    if line_text.strip():
-                        text_parts.append(line_text.strip())
+                for i, span in enumerate(spans):
+                    span_text = (span.get("text") or "").strip()
+                    if not span_text:
+                        continue
 
-            # 页与页之间加入空行分隔，便于LLM解析
-            if page_index < pages_to_read - 1:
-                text_parts.append("")
+                    font_size = span.get("size", 0)
 
-        doc.close()
-        return "\n".join(text_parts)
+                    # 改进的角标识别逻辑
+                    is_superscript = _is_independent_superscript(span, spans, i, font_size, line_avg)
+
+                    if is_superscript:
+                        # 独立的角标，用特殊标记包围
+                        line_text += f" [SUPERSCRIPT:{span_text}] "
+                    else:
+                        # 正常文本或嵌入在姓名中的角标
+                        line_text += span_text + " "
+
+                if line_text.strip():
+                    text_parts.append(line_text.strip())
+
+        # 页与页之间加入空行分隔，便于LLM解析
+        if page_index < pages_to_read - 1:
+            text_parts.append("")
+
+    return "\n".join(text_parts)
 
+
+def _plain_text_first_pages(doc) -> str:
+    if len(doc) == 0:
+        return ""
+    pages_to_read = min(2, len(doc))
+    txt = []
+    for i in range(pages_to_read):
+        txt.append(doc[i].get_text("text"))
+    return "\n\n".join(t.strip() for t in txt if t and t.strip())
+
+
+def _load_page_ctx(pdf_path: Union[str, fitz.Document], mode: str) -> _PageCtx:
+    """
+    只打开一次PDF，按模式取出LLM输入文本；需要作者重排序的模式顺带取第一页 words。
+    由本函数打开的文档在返回前关闭，不会跨越后续的LLM等待。
+    """
+    try:
+        with _as_doc(pdf_path) as doc:
+            return _read_page_ctx(doc, mode)
     except Exception as e:
-        print("PDF span信息提取失败:", e)
-        # 回退：简单提取前两页文本
+        print("PDF文本提取失败:", e)
+        return _PageCtx(page0_text="")
+
+
+def _read_page_ctx(doc, mode: str) -> _PageCtx:
+    need_words = mode not in ['ap', 'sn']
+    page = tp = None
+    if mode == 'ap':
         try:
-            fallback_doc = fitz.open(pdf_path)
-            if len(fallback_doc) == 0:
-                fallback_doc.close()
-                return ""
-            pages_to_read = min(2, len(fallback_doc))
-            txt = []
-            for i in range(pages_to_read):
-                txt.append(fallback_doc[i].get_text("text"))
-            fallback_doc.close()
-            return "\n\n".join(t.strip() for t in txt if t and t.strip())
-        except Exception as _:
-            return ""
+            text = _span_text(doc)
+        except Exception as e:
+            print("PDF span信息提取失败:", e)
+            text = _plain_text_first_pages(doc)
+    elif need_words and len(doc) > 0:
+        # text 与 words 的默认抽取参数相同（TEXTFLAGS_TEXT == TEXTFLAGS_WORDS），
+        # 第一页只建一次 TextPage，两种输出共用，省去一次完整的版面分析
+        page = doc[0]
+        tp = page.get_textpage(flags=fitz.TEXTFLAGS_TEXT)
+        text = page.get_text("text", textpage=tp)
+    else:
+        text = _page0_text(doc)
+    ctx = _PageCtx(page0_text=text)
+    if text and need_words:
+        # 失败时保持 None，由 reorder_authors_by_rows 自行回退
+        try:
+            # TextPage 只弱引用所属 Page，需沿用同一个 Page 对象
+            if page is None:
+                page = doc[0]
+            ctx.page0_words = page.get_text("words", textpage=tp)
+            ctx.page0_height = page.rect.height
+        except Exception as e:
+            print("PDF words提取失败:", e)
+    return ctx
+
+
+# 进程池的启动方式：建池时进程里已有 Flask 请求线程、后台事件循环线程和日志监听线程，
+# fork 会把这些线程持有的锁（logging、MuPDF 内部等）原样复制进子进程，子进程可能死锁。
+# 因此用 forkserver（不支持的平台用 spawn）启动干净的工作进程
+_MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+# PDF解析进程池（首次使用时创建，全局共用）：PyMuPDF解析为CPU密集型，
+# 放在线程里仍受GIL限制，进程池可多核并行，并与LLM网络等待重叠
+_PDF_POOL: Optional[ProcessPoolExecutor] = None
+_PDF_POOL_LOCK = threading.Lock()
+
+
+def _pdf_worker_init():
+    # 子进程内不向 stderr 打印 MuPDF 的解析告警
+    fitz.TOOLS.mupdf_display_errors(False)
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _PDF_POOL
+    with _PDF_POOL_LOCK:
+        if _PDF_POOL is None:
+            _PDF_POOL = ProcessPoolExecutor(max_workers=Config.PDF_WORKERS, mp_context=_MP_CONTEXT,
+                                            initializer=_pdf_worker_init)
+        return _PDF_POOL
+
+
+async def _run_pdf_job(func, pdf_path: Union[str, fitz.Document], *args):
+    """路径交给进程池解析；已打开的 Document 无法跨进程传递，仍在线程中解析"""
+    global _PDF_POOL
+    if isinstance(pdf_path, str):
+        pool = _get_pdf_pool()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, func, pdf_path, *args)
+        except BrokenProcessPool as e:
+            print("PDF解析进程池异常，改用线程解析:", e)
+            with _PDF_POOL_LOCK:
+                if _PDF_POOL is pool:
+                    _PDF_POOL = None
+    return await asyncio.to_thread(func, pdf_path, *args)
+
 
+async def _parse_page_ctx(pdf_path: Union[str, fitz.Document], mode: str) -> _PageCtx:
+    return await _run_pdf_job(_load_page_ctx, pdf_path, mode)
 
-def _is_independent_superscript(span, spans, span_index, font_size):
+
+def _is_independent_superscript(span, spans, span_index, font_size, avg_font_size=None):
     """
     判断是否为独立的角标
 
@@ -215,6 +752,8 @@ def _is_independent_superscript(span, spans, span_index, font_size):
     2. 文本长度较短（通常1-3个字符）
     3. 包含角标符号（*, †, ‡, §, ¶, #, a*, b*, 等）
     4. 独立的span（不与姓名在同一span中）
+
+    avg_font_size 为本行平均字号，调用方按行预先计算后传入；未传入时现算。
     """
     span_text = span["text"].strip()
 
@@ -233,7 +772,8 @@ def _is_independent_superscript(span, spans, span_index, font_size):
         return False
 
     # 字体大小检查 - 相对于周围文本较小
-    avg_font_size = _get_average_font_size(spans)
+    if avg_font_size is None:
+        avg_font_size = _get_average_font_size(spans)
     is_small_font = font_size < avg_font_size * 0.8  # 小于平均字体大小的80%
 
     # 如果字体明显较小，很可能是角标
@@ -270,42 +810,51 @@ def _get_average_font_size(spans):
     return sum(font_sizes) / len(font_sizes) if font_sizes else 12
 
 
-def extract_acknowledgment_from_last_pages(pdf_path: str) -> str:
+_ACK_KEYWORDS = ("ACKNOWLEDGMENT","ACKNOWLEDGMENTS","ACKNOWLEDGEMENT","ACKNOWLEDGEMENTS","致谢","谢辞")
+_ACK_KEYWORDS_LOWER = tuple((k.lower(), k) for k in _ACK_KEYWORDS)
+_REF_KEYWORDS_LOWER = tuple(k.lower() for k in ("REFERENCES","REFERENCE","参考文献"))
+
+
+def extract_acknowledgment_from_last_pages(pdf_path: Union[str, fitz.Document]) -> str:
     try:
-        doc = fitz.open(pdf_path)
-        n = len(doc)
-        if n == 0:
-            doc.close(); return ""
-        pages = [n-2, n-1] if n >= 2 else [n-1]
-        ak = ["ACKNOWLEDGMENT","ACKNOWLEDGMENTS","ACKNOWLEDGEMENT","ACKNOWLEDGEMENTS","致谢","谢辞"]
-        rk = ["REFERENCES","REFERENCE","参考文献"]
-        out = ""
-        for p in pages:
-            page_text = doc[p].get_text("text")
-            pos = -1; kw = ""
-            for k in ak:
-                q = page_text.upper().find(k.upper())
-                if q != -1: pos, kw = q, k; break
-            if pos != -1:
-                end = len(page_text)
-                for r in rk:
-                    q = page_text.upper().find(r.upper(), pos)
-                    if q != -1: end = q; break
-                lines = [ln.strip() for ln in page_text[pos:end].split("\n") if ln.strip()]
-                if lines:
-                    if len(lines[0].replace(kw, "").strip()) < 10: lines = lines[1:]
-                out = " ".join(lines).strip(); break
-        doc.close()
-        if out and len(out) >= 20:
-            out = re.sub(r"\d+\s*$", "", out)
-            out = re.sub(r"\s+", " ", out).strip()
-            return out[:1000] + ("..." if len(out) > 1000 else "")
-        return ""
+        with _as_doc(pdf_path) as doc:
+            n = len(doc)
+            if n == 0:
+                return ""
+            pages = [n-2, n-1] if n >= 2 else [n-1]
+            out = ""
+            for p in pages:
+                page_text = doc[p].get_text("text")
+                # 每页只做一次小写转换；lower() 对连字(ﬁ等)不改变长度，偏移可直接用于原文
+                lower = page_text.lower()
+                pos = -1; kw = ""
+                for k_low, k in _ACK_KEYWORDS_LOWER:
+                    q = lower.find(k_low)
+                    if q != -1: pos, kw = q, k; break
+                if pos != -1:
+                    end = len(page_text)
+                    for r_low in _REF_KEYWORDS_LOWER:
+                        q = lower.find(r_low, pos)
+                        if q != -1: end = q; break
+                    lines = [ln.strip() for ln in page_text[pos:end].split("\n") if ln.strip()]
+                    if lines:
+                        if len(lines[0].replace(kw, "").strip()) < 10: lines = lines[1:]
+                    out = " ".join(lines).strip(); break
+            if out and len(out) >= 20:
+                out = _TAIL_DIGITS_RE.sub("", out)
+                out = _ALL_WS_RE.sub(" ", out).strip()
+                return out[:1000] + ("..." if len(out) > 1000 else "")
+            return ""
     except Exception as e:
         print("致谢信息提取失败:", e)
         return ""
 
 
+async def extract_acknowledgment_async(pdf_path: Union[str, fitz.Document]) -> str:
+    """异步版本：在共用的PDF解析进程池中提取致谢，并发量受 Config.PDF_WORKERS 限制"""
+    return await _run_pdf_job(extract_acknowledgment_from_last_pages, pdf_path)
+
+
 # =========================
 # 作者定位与排序（基于 words ）
 # =========================
@@ -314,38 +863,54 @@ BAD_AFFIL_KW = {
     'university','institute','department','school','college','laboratory','lab','company',
     'inc.','co.','co.,ltd','co.ltd','ltd','center','centre','academy','hospital','research'
 }
+# 单位关键词（对应 BAD_AFFIL_KW，含复数形式）合成一个按词边界匹配的正则，
+# 一次扫描完成，且不会误伤 "Labibi" 这类含关键词子串的姓名
+# 单独的 "Co"/"CO" 可能是姓名的一部分，只有带点（co.、co.,ltd）或带 ltd 后缀（co ltd、co,ltd）时才算公司关键词
+_BAD_AFFIL_RE = re.compile(
+    r"\b(?:(?:universit(?:y|ies)|institutes?|departments?|schools?|colleges?|laborator(?:y|ies)|labs?"
+    r"|compan(?:y|ies)|inc\.?|ltd|cent(?:er|re)s?|academ(?:y|ies)|hospitals?|research)\b"
+    r"|co\.(?:,?\s*ltd\b)?|co,?\s*ltd\b)",
+    re.I,
+)
 SEPS = {',',';'}
 SEP_WORDS = {'and','&'}
+_HAN_NAME_RE = reg.compile(r"^\p{Han}{2,4}$")
 
 
-def _match_score(a: str, b: str) -> float:
-    a, b = a.lower().strip(), b.lower().strip()
-    s1 = difflib.SequenceMatcher(None, a, b).ratio()
-    pa, pb = a.split(), b.split()
-    s2 = difflib.SequenceMatcher(None, " ".join(reversed(pa)), " ".join(reversed(pb))).ratio()
+def _prep_names(strs: List[str]) -> Tuple[List[str], List[str]]:
+    """一次性归一化：casefold + strip，并预先生成 token 逆序形式。"""
+    fwd = [x.casefold().strip() for x in strs]
+    rev = [" ".join(reversed(x.split())) for x in fwd]
+    return fwd, rev
+
+
+def _score_matrix(names: List[str], texts: List[str]) -> np.ndarray:
+    """姓名 × 姓名盒 的相似度矩阵（0~1 量纲）。正序与逆序 token 各算一次取较大值。"""
+    na, na_rev = _prep_names(names)
+    tb, tb_rev = _prep_names(texts)
+    # RapidFuzz 批量打分（C++实现），输入已归一化，processor=None 跳过逐对预处理
+    s1 = process.cdist(na, tb, scorer=fuzz.ratio, processor=None)
+    s2 = process.cdist(na_rev, tb_rev, scorer=fuzz.ratio, processor=None)
+    sc = np.maximum(s1, s2).astype(np.float64) / 100.0
     # 中文姓名轻微加权
-    try:
-        if reg.match(r"^\p{Han}{2,4}$", a):
-            s1 += 0.05; s2 += 0.05
-    except Exception:
-        pass
-    return max(s1, s2)
+    han = np.fromiter((bool(_HAN_NAME_RE.match(a)) for a in na), dtype=bool, count=len(na))
+    sc[han] += 0.05
+    return sc
 
 
-def _words_top_region(page, top_ratio=0.8) -> List[Tuple[float,float,float,float,str,int,int,int]]:
-    """获取上方区域的 words 列表。返回 (x0,y0,x1,y1,txt,block,line,word)"""
-    H = page.rect.height
-    w = [w for w in page.get_text("words") if w[1] <= H*top_ratio]
-    # 过滤明显无意义的词
+def _words_top_region(page_words, H, top_ratio=0.8) -> List[Tuple[float,float,float,float,str,int,int,int]]:
+    """从第一页 words 中取上方区域。返回 (x0,y0,x1,y1,txt,block,line,word)"""
+    ythr = H*top_ratio
     out = []
-    for x0,y0,x1,y1,txt,blk,ln,wd in w:
+    for x0,y0,x1,y1,txt,blk,ln,wd in page_words:
+        if y0 > ythr: continue
         t = txt.strip()
         if not t: continue
-        # 过滤只含标点/数字
-        letters = sum(c.isalpha() for c in t)
-        if letters < max(1, int(0.5*len(t))):
-            # 但是如果就是分隔符，也保留（用于切分）
-            if t.lower() not in SEP_WORDS and t not in SEPS:
+        # 纯字母词与分隔符直接保留（分隔符用于切分）
+        if not t.isalpha() and t not in SEPS and t.lower() not in SEP_WORDS:
+            # 过滤只含标点/数字
+            letters = sum(map(str.isalpha, t))
+            if letters < max(1, int(0.5*len(t))):
                 continue
         out.append((x0,y0,x1,y1,t,blk,ln,wd))
     return out
@@ -353,18 +918,26 @@ def _words_top_region(page, top_ratio=0.8) -> List[Tuple[float,float,float,float
 
 def _group_lines(words):
     """按 (block,line) 分组，得到有序的“行”。每行内按 x0 升序。"""
-    lines: Dict[Tuple[int,int], List[tuple]] = {}
-    for w in words:
-        key = (w[5], w[6])
-        lines.setdefault(key, []).append(w)
-    # 按 y0 排序行，再行内按 x0
-    ordered = []
-    for key, ws in lines.items():
-        ws.sort(key=lambda z: z[0])
-        y_mean = sum(z[1] for z in ws)/len(ws)
-        ordered.append((y_mean, ws))
-    ordered.sort(key=lambda p: p[0])
-    return [ws for _, ws in ordered]
+    if not words:
+        return []
+    n = len(words)
+    keys = np.fromiter((k for w in words for k in (w[5], w[6])), dtype=np.int64, count=2*n).reshape(n, 2)
+    x0 = np.fromiter((w[0] for w in words), dtype=np.float64, count=n)
+    y0 = np.fromiter((w[1] for w in words), dtype=np.float64, count=n)
+    # 行号 = (block,line) 的分组编号；first 记录该行首次出现的位置，用于相同 y 时保持原顺序
+    _, first, inv = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    inv = inv.reshape(-1)
+    counts = np.bincount(inv)
+    y_mean = np.bincount(inv, weights=y0) / counts
+    # 行按 y0 均值排序，得到每行的名次；再以 (行名次, x0) 一次 lexsort 排好全部 words
+    line_order = np.lexsort((first, y_mean))
+    rank = np.empty_like(line_order)
+    rank[line_order] = np.arange(len(line_order))
+    order = np.lexsort((x0, rank[inv])).tolist()
+    out = []; k = 0
+    for c in counts[line_order].tolist():
+        out.append([words[i] for i in order[k:k+c]]); k += c
+    return out
 
 
 def _split_authors_on_line(ws):
@@ -387,11 +960,15 @@ def _split_authors_on_line(ws):
         text = " ".join(t[4] for t in toks).strip()
         if not text: continue
         tl = text.lower()
-        if any(k in tl for k in BAD_AFFIL_KW):
+        if _BAD_AFFIL_RE.search(tl):
             # 跳过明显是单位的片段
             continue
-        x0 = min(t[0] for t in toks); y0 = min(t[1] for t in toks)
-        x1 = max(t[2] for t in toks); y1 = max(t[3] for t in toks)
+        x0, y0, x1, y1 = toks[0][:4]
+        for t in toks:
+            if t[0] < x0: x0 = t[0]
+            if t[1] < y0: y0 = t[1]
+            if t[2] > x1: x1 = t[2]
+            if t[3] > y1: y1 = t[3]
         boxes.append({
             "text": text,
             "bbox": (x0,y0,x1,y1),
@@ -402,9 +979,9 @@ def _split_authors_on_line(ws):
     return boxes
 
 
-def _collect_author_boxes(page) -> List[Dict[str,Any]]:
+def _collect_author_boxes(page_words, page_height) -> List[Dict[str,Any]]:
     """主函数：基于 words 提取“姓名盒”。兼容单行、单栏多行、双栏、多栏。"""
-    words = _words_top_region(page)
+    words = _words_top_region(page_words, page_height)
     if not words:
         return []
     lines = _group_lines(words)
@@ -415,54 +992,79 @@ def _collect_author_boxes(page) -> List[Dict[str,Any]]:
 
 
 def _bind_names_to_boxes(author_names: List[str], boxes: List[Dict[str,Any]]):
-    used = set(); bound = []
-    for name in author_names:
-        best, best_i, best_sc = None, -1, 0.0
-        for i, b in enumerate(boxes):
-            if i in used: continue
-            sc = _match_score(name, b["text"])
-            if sc > best_sc: best, best_i, best_sc = b, i, sc
-        if best is not None and best_sc >= 0.55:
-            used.add(best_i); bound.append({"name": name, **best, "score": best_sc})
-        else:
-            bound.append({"name": name, "bbox": None, "cx": None, "cy": None, "h": None, "score": 0.0})
+    """姓名与姓名盒做全局最优匹配（匈牙利算法），得分低于 0.55 视为未绑定。"""
+    bound = [{"name": name, "bbox": None, "cx": None, "cy": None, "h": None, "score": 0.0} for name in author_names]
+    if not author_names or not boxes:
+        return bound
+    sc = _score_matrix(author_names, [b["text"] for b in boxes])
+    rows, cols = linear_sum_assignment(sc, maximize=True)
+    for r, c in zip(rows, cols):
+        if sc[r, c] >= 0.55:
+            bound[r] = {"name": author_names[r], **boxes[c], "score": float(sc[r, c])}
     return bound
 
 
+def _push_median(lo: List[float], hi: List[float], v: float) -> float:
+    """双堆在线中位数：lo 为最大堆(存负值)，hi 为最小堆。插入 v 后返回当前中位数，O(log N)。"""
+    if lo and v > -lo[0]:
+        heapq.heappush(hi, v)
+    else:
+        heapq.heappush(lo, -v)
+    if len(lo) > len(hi) + 1:
+        heapq.heappush(hi, -heapq.heappop(lo))
+    elif len(hi) > len(lo):
+        heapq.heappush(lo, -heapq.heappop(hi))
+    return -lo[0] if len(lo) > len(hi) else (-lo[0] + hi[0]) / 2
+
+
 def _cluster_rows_by_y(bound_points: List[Dict[str,Any]]):
     pts = [p for p in bound_points if p["cx"] is not None]
     if not pts: return []
-    pts.sort(key=lambda x: x["cy"])  # 先按 y
+    cy = np.fromiter((p["cy"] for p in pts), dtype=np.float64, count=len(pts))
+    pts = [pts[i] for i in np.argsort(cy, kind="stable")]  # 先按 y
     hs = [p["h"] for p in pts if p["h"]]
-    h_med = median(hs) if hs else 12.0
+    h_med = float(np.median(hs)) if hs else 12.0
     tau = max(h_med*0.6, 4.0)
-    rows = []; cur = [pts[0]]; cur_cy = pts[0]["cy"]
+    # 每行维护在线中位数，行结束时的中位数直接作为该行排序键
+    rows = []; row_cy = []
+    cur = [pts[0]]; lo, hi = [], []; cur_cy = _push_median(lo, hi, pts[0]["cy"])
     for p in pts[1:]:
         if abs(p["cy"] - cur_cy) <= tau:
-            cur.append(p); cur_cy = median([q["cy"] for q in cur])
+            cur.append(p); cur_cy = _push_median(lo, hi, p["cy"])
         else:
-            rows.append(cur); cur = [p]; cur_cy = p["cy"]
-    if cur: rows.append(cur)
+            rows.append(cur); row_cy.append(cur_cy)
+            cur = [p]; lo, hi = [], []; cur_cy = _push_median(lo, hi, p["cy"])
+    rows.append(cur); row_cy.append(cur_cy)
     for r in rows: r.sort(key=lambda x: x["cx"])  # 行内左→右
-    rows.sort(key=lambda r: median([p["cy"] for p in r]))
-    return rows
+    return [rows[i] for i in np.argsort(row_cy, kind="stable")]
 
 
-def reorder_authors_by_rows(pdf_path: str, authors: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def reorder_authors_by_rows(pdf_path: Union[str, fitz.Document], authors: List[Dict[str, Any]],
+                            ctx: Optional[_PageCtx] = None) -> List[Dict[str, Any]]:
     if len(authors) <= 1:
         return authors
     try:
-        doc = fitz.open(pdf_path); page = doc[0]
-        boxes = _collect_author_boxes(page)
-        if not boxes:
-            doc.close(); return authors  # 不再做会破坏顺序的启发式
+        if ctx is None or ctx.page0_words is None:
+            with _as_doc(pdf_path) as doc:
+                page = doc[0]
+                page_words, page_height = page.get_text("words"), page.rect.height
+        else:
+            page_words, page_height = ctx.page0_words, ctx.page0_height
+        need = max(2, int(0.7*len(authors)))
+        boxes = _collect_author_boxes(page_words, page_height)
+        if len(boxes) < need:
+            return authors  # 姓名盒不足，绑定数必然不达标，不再做会破坏顺序的启发式
         names = [a.get("name", "") for a in authors]
         bound = _bind_names_to_boxes(names, boxes)
         ok = [b for b in bound if b["cx"] is not None]
-        if len(ok) < max(2, int(0.7*len(authors))):
-            doc.close(); return authors
+        if len(ok) < need:
+            return authors
         rows = _cluster_rows_by_y(ok)
         ordered_names = [p["name"] for row in rows for p in row]
+        if ordered_names == names:
+            # 版面顺序与LLM顺序一致（常见情况），只需重写 order
+            for i,a in enumerate(authors,1): a["order"]=i
+            return authors
         name2idx = {a.get("name"," "): i for i,a in enumerate(authors)}
         used=set(); reordered=[]
         for nm in ordered_names:
@@ -472,33 +1074,100 @@ def reorder_authors_by_rows(pdf_path: str, authors: List[Dict[str, Any]]) -> Lis
         for i,a in enumerate(authors):
             if i not in used: reordered.append(a)
         for i,a in enumerate(reordered,1): a["order"]=i
-        doc.close(); return reordered
+        return reordered
     except Exception as e:
         print("按行排序失败:", e)
         return authors
 
 
-def fix_author_order_precise(authors: List[Dict[str, Any]], pdf_path: str) -> List[Dict[str, Any]]:
-    return reorder_authors_by_rows(pdf_path, authors)
+def fix_author_order_precise(authors: List[Dict[str, Any]], pdf_path: Union[str, fitz.Document],
+                             ctx: Optional[_PageCtx] = None) -> List[Dict[str, Any]]:
+    return reorder_authors_by_rows(pdf_path, authors, ctx)
 
 
 # =========================
 # 主流程
 # =========================
 
-async def extract_first_page_llm(pdf_path: str, mode: str = 'sn') -> tuple[PaperMeta, int]:
-    # AP模式使用改进的文本提取，其他模式使用原有方法
-    if mode == 'ap':
-        text_content = extract_text_with_span_info(pdf_path)
-    else:
-        text_content = extract_text_from_pdf(pdf_path)
+async def _lookup_result(pdf_path: Union[str, fitz.Document],
+                         mode: str) -> tuple[Optional[Tuple[str, str]], Optional[tuple[PaperMeta, int]]]:
+    """
+    按文件内容哈希查结果缓存（内存 -> 磁盘），返回 (缓存key, 命中结果)。
+    命中时 tokens 记为 0；Document 对象无法取哈希，key 为 None，不走缓存。
+    内存缓存大小为 0 且未配置持久化文件时不读文件算哈希，key 同样为 None。
+    """
+    if not isinstance(pdf_path, str):
+        return None, None
+    if Config.META_CACHE_SIZE <= 0 and not Config.META_CACHE_FILE:
+        return None, None
+    try:
+        key = (await asyncio.to_thread(_file_digest, pdf_path), mode)
+    except OSError:
+        return None, None
+    hit = _cache_get(_META_CACHE, key)
+    if hit is None:
+        hit = await asyncio.to_thread(_disk_cache_get, key)
+        if hit is not None:
+            _cache_put(_META_CACHE, key, hit, Config.META_CACHE_SIZE)
+    if hit is not None:
+        return key, (copy.deepcopy(hit[0]), 0)
+    return key, None
+
+
+async def _load_ctx(pdf_path: Union[str, fitz.Document], mode: str, key: Optional[Tuple[str, str]]) -> _PageCtx:
+    """取页面解析结果：优先用解析缓存（LLM失败重试时无需重新解析），否则解析并缓存"""
+    ctx = _cache_get(_CTX_CACHE, key) if key is not None else None
+    if ctx is None:
+        ctx = await _parse_page_ctx(pdf_path, mode)
+        if key is not None and ctx.page0_text:
+            _cache_put(_CTX_CACHE, key, ctx, _CTX_CACHE_SIZE)
+    return ctx
+
+
+async def _store_result(key: Optional[Tuple[str, str]], meta: PaperMeta, tokens_used: int):
+    """只缓存LLM成功返回的结果（内存 + 磁盘），失败的下次重新请求"""
+    if key is not None and (meta.title or meta.authors):
+        _cache_put(_META_CACHE, key, (copy.deepcopy(meta), tokens_used), Config.META_CACHE_SIZE)
+        await asyncio.to_thread(_disk_cache_put, key, meta, tokens_used)
+
+
+async def extract_first_page_llm(pdf_path: Union[str, fitz.Document], mode: str = 'sn',
+                                 session: Optional[aiohttp.ClientSession] = None) -> tuple[PaperMeta, int]:
+    # 只打开一次PDF：AP模式使用改进的文本提取，其他模式使用原有方法；
+    # 需要重排序的模式同时缓存第一页 words，供 fix_author_order_precise 复用。
+    # PyMuPDF解析放到进程池中执行，避免阻塞事件循环上其他文件的LLM请求
+    # 命中内容缓存时直接返回（tokens 记为 0）
+    key, hit = await _lookup_result(pdf_path, mode)
+    if hit is not None:
+        return hit
+    ctx = await _load_ctx(pdf_path, mode, key)
+    meta, tokens_used = await _meta_from_ctx(ctx, pdf_path, mode, session)
+    await _store_result(key, meta, tokens_used)
+    return meta, tokens_used
+
+
+async def _meta_from_ctx(ctx: _PageCtx, pdf_path: Union[str, fitz.Document], mode: str,
+                         session: Optional[aiohttp.ClientSession] = None) -> tuple[PaperMeta, int]:
+    """由已解析的页面上下文调用LLM并组装 PaperMeta"""
+    text_content = ctx.page0_text
 
     if not text_content:
-        return PaperMeta(title="", abstract=None, keywords=[], authors=[], affiliations=[], emails=[], confidence=0.0), 0
-    llm_result, tokens_used = await call_llm_api(text_content, mode)
-    if not llm_result:
-        return PaperMeta(title="", abstract=None, keywords=[], authors=[], affiliations=[], emails=[], confidence=0.0), tokens_used or 0
+        return _empty_meta(), 0
+    text_key = (_text_digest(text_content), mode)
+    cached = _cache_get(_LLM_CACHE, text_key)
+    if cached is not None:
+        # 后续作者重排序会原地修改 dict，取副本
+        llm_result, tokens_used = copy.deepcopy(cached), 0
+    else:
+        llm_result, tokens_used = await _call_llm(text_content, mode, session)
+        if not llm_result:
+            return _empty_meta(), tokens_used or 0
+        _cache_put(_LLM_CACHE, text_key, copy.deepcopy(llm_result), Config.META_CACHE_SIZE)
+    return _build_meta(llm_result, ctx, pdf_path, mode), tokens_used
+
 
+def _build_meta(llm_result: dict, ctx: _PageCtx, pdf_path: Union[str, fitz.Document], mode: str) -> PaperMeta:
+    """LLM结果 → PaperMeta（含作者顺序修正与单位去重）"""
     # 修正作者顺序 - AP和SN模式跳过复杂的双栏判定逻辑
     author_list = llm_result.get('authors', []) or []
     if mode in ['ap', 'sn']:
@@ -506,18 +1175,21 @@ async def extract_first_page_llm(pdf_path: str, mode: str = 'sn') -> tuple[Paper
         corrected_authors = author_list
     else:
         # 复杂模式：使用双栏判定逻辑
-        corrected_authors = fix_author_order_precise(author_list, pdf_path)
+        corrected_authors = fix_author_order_precise(author_list, pdf_path, ctx)
 
     # 单位去重映射
+    # 去重键：压缩空白 + casefold，"Beihang  University " 与 "beihang university" 视为同一单位；
+    # 展示名沿用首次出现时的写法
     affiliations: List[Affiliation] = []
     aff_map: Dict[str, str] = {}
     def _get_aff_id(name: str) -> Optional[str]:
         if not name: return None
-        key = name.strip()
-        if key in aff_map: return aff_map[key]
-        idx = str(len(affiliations) + 1)
-        affiliations.append(Affiliation(id=idx, name=key, raw=key))
-        aff_map[key] = idx
+        display = name.strip()
+        key = _WS_RE.sub(" ", display).casefold()
+        idx = aff_map.get(key)
+        if idx is None:
+            idx = aff_map[key] = str(len(aff_map) + 1)
+            affiliations.append(Affiliation(id=idx, name=display, raw=name))
         return idx
 
     authors: List[Author] = []
@@ -542,16 +1214,58 @@ async def extract_first_page_llm(pdf_path: str, mode: str = 'sn') -> tuple[Paper
         emails=llm_result.get('emails', []) or [],
         confidence=float(llm_result.get('confidence', 0.0) or 0.0)
     )
-    # 返回元数据和tokens使用量
-    return meta, tokens_used
+    return meta
 
 
-def extract_first_page(pdf_path: str) -> tuple[PaperMeta, int]:
-    loop = asyncio.new_event_loop(); asyncio.set_event_loop(loop)
-    try:
-        return loop.run_until_complete(extract_first_page_llm(pdf_path))
-    finally:
-        loop.close()
+async def extract_many(pdf_paths: List[str], mode: str = 'sn', concurrency: int = 16) -> List[tuple[PaperMeta, int]]:
+    """
+    并发提取多篇PDF的元数据，结果顺序与 pdf_paths 一致。
+    所有LLM请求共用一个 ClientSession（常驻循环上为全局会话，否则为本批临时会话），
+    并由信号量限制同时在飞的请求数。
+    开启请求合并（Config.LLM_BATCH_SIZE > 1）时，同时在飞的请求自动合并发送（见 _call_llm）。
+    """
+    sem = asyncio.Semaphore(concurrency)
+
+    async def _one(path: str, session: aiohttp.ClientSession) -> tuple[PaperMeta, int]:
+        async with sem:
+            return await extract_first_page_llm(path, mode, session)
+    async with _session_scope() as session:
+        return await asyncio.gather(*[_one(p, session) for p in pdf_paths])
+
+
+# 同步接口共用的后台事件循环（常驻线程），HTTP会话与连接池可跨调用复用
+_BG_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_BG_LOCK = threading.Lock()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    global _BG_LOOP
+    with _BG_LOCK:
+        if _BG_LOOP is None or _BG_LOOP.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="metadata-loop", daemon=True).start()
+            _BG_LOOP = loop
+    return _BG_LOOP
+
+
+def run_sync(coro):
+    """在后台事件循环上执行协程并阻塞等待结果（供同步代码调用）"""
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop()).result()
+
+
+def extract_first_page(pdf_path: str, mode: str = 'sn') -> tuple[PaperMeta, int]:
+    """
+    同步单文件接口，调用期间阻塞直到LLM返回。
+    不要在循环中逐个调用处理多个文件（会把请求串行化），批量请使用
+    extract_first_page_batch / extract_many 或 ConcurrentProcessor.process_batch。
+    """
+    return run_sync(extract_first_page_llm(pdf_path, mode))
+
+
+def extract_first_page_batch(pdf_paths: List[str], mode: str = 'sn',
+                             concurrency: int = 16) -> List[tuple[PaperMeta, int]]:
+    """同步批量提取，所有文件在同一事件循环上并发执行，结果顺序与 pdf_paths 一致"""
+    return run_sync(extract_many(pdf_paths, mode, concurrency))
 
 
 if __name__ == "__main__":
@@ -561,8 +1275,11 @@ if __name__ == "__main__":
         "title": meta.title,
         "abstract": meta.abstract,
         "keywords": meta.keywords,
-        "authors": [asdict(a) for a in meta.authors],
-        "affiliations": [asdict(aff) for aff in meta.affiliations],
+        "authors": [{"order": a.order, "name": a.name, "superscripts": a.superscripts,
+                     "affiliation_ids": a.affiliation_ids, "email": a.email,
+                     "is_first_author": a.is_first_author,
+                     "is_corresponding_author": a.is_corresponding_author} for a in meta.authors],
+        "affiliations": [{"id": aff.id, "name": aff.name, "raw": aff.raw} for aff in meta.affiliations],
         "emails": meta.emails,
         "confidence": meta.confidence,
         "tokens_used": tokens_used
@@ -5,12 +5,14 @@
 """
 
 import asyncio
+import functools
 import time
 import logging
-from typing import List, Dict, Any, Callable, Optional
+from typing import List, Dict, Any, Callable, Optional, AsyncIterator, Tuple, Union
 from dataclasses import dataclass
 from collections import deque
 import threading
+import weakref
 from concurrent.futures import ThreadPoolExecutor
 import os
 
@@ -18,6 +20,14 @@ import os
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 错误信息关键字 -> 错误分类，按优先级顺序匹配
+_ERR_TAGS = (
+    ('API密钥', 'auth'), ('401', 'auth'),
+    ('频率过高', 'rate_limit'), ('429', 'rate_limit'),
+    ('超时', 'timeout'),
+    ('网络', 'network'),
+)
+
 @dataclass
 class RateLimitConfig:
     """速率限制配置"""
@@ -37,41 +47,68 @@ class RateLimiter:
         self.request_times = deque()        # 最近一分钟请求时间
         self.second_request_times = deque()  # 最近一秒请求时间
         self.token_usage = deque()
+        self._token_sum = 0                 # token_usage 窗口内的累计值，增量维护
+        self._next_expiry = float('inf')    # 下一条记录过期的时刻，之前调用 _expire 可直接返回
+        # 统计接口在 Flask 请求线程中读取限流器，与事件循环线程并发，锁仍然需要
         self.lock = threading.Lock()
 
+        # 各窗口阈值在构造时算好，避免每次准入检查重复取属性与乘法
+        self._rps = config.rps
+        self._rpm_cap = config.rpm * 0.9  # 90%安全边距
+        self._tpm_cap = config.tpm * 0.9  # 90%安全边距
+
         # 计算安全的请求间隔：同时满足RPS与RPM
         min_interval_by_rpm = 60.0 / config.rpm if config.rpm > 0 else 0.0
-        min_interval_by_rps = 1.0 / config.rps if getattr(config, 'rps', 0) > 0 else 0.0
+        min_interval_by_rps = 1.0 / config.rps if config.rps > 0 else 0.0
         self.min_request_interval = max(min_interval_by_rpm, min_interval_by_rps)
         self.safe_request_interval = self.min_request_interval * 1.2  # 增加20%安全边距
+        self._next_slot = 0.0  # 下一个可预约的发送时刻
+
+    def _expire(self, current_time: float):
+        """清理过期的请求记录（1分钟前 & 1秒前），调用方需持有锁"""
+        # 最早一条记录都还没过期时无需扫描
+        if current_time <= self._next_expiry:
+            return
+        while self.request_times and current_time - self.request_times[0] > 60:
+            self.request_times.popleft()
+        while self.second_request_times and current_time - self.second_request_times[0] > 1:
+            self.second_request_times.popleft()
+        while self.token_usage and current_time - self.token_usage[0][0] > 60:
+            self._token_sum -= self.token_usage.popleft()[1]
+        # 三个窗口的队首里最早过期的时刻
+        self._next_expiry = min(
+            self.second_request_times[0] + 1 if self.second_request_times else float('inf'),
+            self.request_times[0] + 60 if self.request_times else float('inf'),
+            self.token_usage[0][0] + 60 if self.token_usage else float('inf'),
+        )
 
-    def can_make_request(self, estimated_tokens: int = 1000) -> bool:
-        """检查是否可以发起请求（同时考虑RPS、RPM、TPM）"""
-        with self.lock:
-            current_time = time.time()
+    def _window_wait(self, current_time: float, estimated_tokens: int) -> float:
+        """各窗口还需等待的秒数；0 表示窗口未满（同时考虑RPS、RPM、TPM），调用方需持有锁"""
+        self._expire(current_time)
+        wait = 0.0
 
-            # 清理过期的请求记录（1分钟前 & 1秒前）
-            while self.request_times and current_time - self.request_times[0] > 60:
-                self.request_times.popleft()
-            while self.second_request_times and current_time - self.second_request_times[0] > 1:
-                self.second_request_times.popleft()
-            while self.token_usage and current_time - self.token_usage[0][0] > 60:
-                self.token_usage.popleft()
+        # 检查RPS限制：等到最早一条记录移出1秒窗口
+        if self._rps > 0 and len(self.second_request_times) >= self._rps:
+            wait = max(wait, self.second_request_times[0] + 1 - current_time)
 
-            # 检查RPS限制
-            if getattr(self.config, 'rps', 0) > 0 and len(self.second_request_times) >= self.config.rps:
-                return False
+        # 检查RPM限制
+        if self.request_times and len(self.request_times) >= self._rpm_cap:
+            wait = max(wait, self.request_times[0] + 60 - current_time)
 
-            # 检查RPM限制
-            if len(self.request_times) >= self.config.rpm * 0.9:  # 90%安全边距
-                return False
+        # 检查TPM限制
+        if self.token_usage and self._token_sum + estimated_tokens > self._tpm_cap:
+            wait = max(wait, self.token_usage[0][0] + 60 - current_time)
 
-            # 检查TPM限制
-            current_tokens = sum(usage[1] for usage in self.token_usage)
-            if current_tokens + estimated_tokens > self.config.tpm * 0.9:  # 90%安全边距
-                return False
+        return wait
 
-            return True
+    def _retry_after(self, estimated_tokens: int = 1000) -> float:
+        """返回还需等待的秒数；0 表示现在即可发起请求"""
+        with self.lock:
+            return self._window_wait(time.time(), estimated_tokens)
+
+    def can_make_request(self, estimated_tokens: int = 1000) -> bool:
+        """检查是否可以发起请求（同时考虑RPS、RPM、TPM）"""
+        return self._retry_after(estimated_tokens) <= 0
 
     def record_request(self, tokens_used: int = 1000):
         """记录请求（更新1秒与1分钟窗口统计）"""
@@ -80,18 +117,29 @@ class RateLimiter:
             self.request_times.append(current_time)
             self.second_request_times.append(current_time)
             self.token_usage.append((current_time, tokens_used))
+            self._token_sum += tokens_used
+            self._next_expiry = min(self._next_expiry, current_time + 1)
 
     async def wait_for_rate_limit(self, estimated_tokens: int = 1000):
-        """等待直到可以发起请求"""
-        while not self.can_make_request(estimated_tokens):
-            await asyncio.sleep(0.1)
-        
-        # 额外等待以确保请求间隔
-        if self.request_times:
-            time_since_last = time.time() - self.request_times[-1]
-            if time_since_last < self.safe_request_interval:
-                wait_time = self.safe_request_interval - time_since_last
-                await asyncio.sleep(wait_time)
+        """
+        等待直到可以发起请求。
+        窗口未满时在锁内预约一个发送时刻（与上一个预约至少相隔安全间隔），然后在锁外睡到该时刻；
+        各等待者拿到的时刻互不相同，不会在同一时刻被一起放行。窗口已满时直接睡到最早记录过期再复查。
+        """
+        while True:
+            with self.lock:
+                current_time = time.time()
+                wait = self._window_wait(current_time, estimated_tokens)
+                if wait <= 0:
+                    slot = max(current_time, self._next_slot)
+                    self._next_slot = slot + self.safe_request_interval
+                    break
+            # 多留1ms，避免因时钟精度刚好卡在窗口边界上
+            await asyncio.sleep(wait + 0.001)
+
+        delay = slot - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
 
 class ConcurrentProcessor:
     """并发处理器"""
@@ -99,74 +147,84 @@ class ConcurrentProcessor:
     def __init__(self, config: RateLimitConfig = None):
         self.config = config or RateLimitConfig()
         self.rate_limiter = RateLimiter(self.config)
-        # 使用最大并发信号量进行硬性限流
-        self.semaphore = asyncio.Semaphore(self.config.max_concurrent)
+        # 使用最大并发信号量进行硬性限流（同一事件循环上的所有批次与直接调用共享）。
+        # asyncio 信号量绑定首次等待它的事件循环，因此每个循环各建一个：服务内所有请求都在
+        # run_sync 的常驻循环上，共用同一个；脚本/测试里的 asyncio.run 另用自己的，互不报错
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = \
+            weakref.WeakKeyDictionary()
+        self._inflight = 0  # 持有信号量、正在处理中的文件数（用于统计）
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        """当前事件循环的并发信号量（首次使用时创建）"""
+        loop = asyncio.get_running_loop()
+        sem = self._semaphores.get(loop)
+        if sem is None:
+            sem = self._semaphores[loop] = asyncio.Semaphore(max(1, self.config.max_concurrent))
+        return sem
 
     async def process_single_file(self, file_path: str, process_func: Callable, mode: str) -> Dict[str, Any]:
         """处理单个文件"""
-        async with self.semaphore:
-            for attempt in range(self.config.retry_attempts):
-                try:
-                    # 等待速率限制
-                    await self.rate_limiter.wait_for_rate_limit()
-                    
-                    # 记录请求开始
-                    start_time = time.time()
-                    self.rate_limiter.record_request()
-                    
-                    # 执行处理
-                    result = await process_func(file_path, mode)
-                    
-                    # 计算处理时间
-                    processing_time = time.time() - start_time
-                    
-                    # 添加处理信息
-                    if isinstance(result, dict):
-                        result['processing_time'] = round(processing_time, 2)
-                        result['attempt'] = attempt + 1
-                    
-                    logger.info(f"成功处理文件: {os.path.basename(file_path)} (耗时: {processing_time:.2f}s)")
-                    return result
-                    
-                except Exception as e:
-                    error_msg = str(e)
-                    logger.warning(f"处理文件失败 (尝试 {attempt + 1}/{self.config.retry_attempts}): {os.path.basename(file_path)} - {error_msg}")
-
-                    if attempt < self.config.retry_attempts - 1:
-                        # 指数退避重试
-                        wait_time = self.config.retry_delay * (2 ** attempt)
-                        logger.info(f"等待 {wait_time:.1f} 秒后重试...")
-                        await asyncio.sleep(wait_time)
-                    else:
-                        # 最后一次尝试失败，返回详细错误结果
-                        filename = os.path.basename(file_path)
-                        # 去掉.pdf扩展名
-                        if filename.lower().endswith('.pdf'):
-                            filename = filename[:-4]
-
-                        error_details = {
-                            'file': file_path,
-                            'filename': filename,
-                            'error': error_msg,
-                            'status': 'failed',
-                            'attempts': self.config.retry_attempts,
-                            'error_type': type(e).__name__,
-                            'processing_time': time.time() - start_time
-                        }
-
-                        # 提供更具体的错误分类
-                        if "API密钥" in error_msg or "401" in error_msg:
-                            error_details['error_category'] = 'auth'
-                        elif "频率过高" in error_msg or "429" in error_msg:
-                            error_details['error_category'] = 'rate_limit'
-                        elif "超时" in error_msg:
-                            error_details['error_category'] = 'timeout'
-                        elif "网络" in error_msg:
-                            error_details['error_category'] = 'network'
-                        else:
-                            error_details['error_category'] = 'processing'
-
-                        return error_details
+        async with self._semaphore():
+            self._inflight += 1
+            try:
+                return await self._process_with_retry(file_path, process_func, mode)
+            finally:
+                self._inflight -= 1
+
+    async def _process_with_retry(self, file_path: str, process_func: Callable, mode: str) -> Dict[str, Any]:
+        """带速率限制与指数退避重试的单文件处理"""
+        # 文件名只解析一次，供日志与错误结果复用
+        basename = os.path.basename(file_path)
+        stem = basename[:-4] if basename.lower().endswith('.pdf') else basename
+        for attempt in range(self.config.retry_attempts):
+            try:
+                # 等待速率限制
+                await self.rate_limiter.wait_for_rate_limit()
+                
+                # 记录请求开始
+                start_time = time.time()
+                self.rate_limiter.record_request()
+                
+                # 执行处理
+                result = await process_func(file_path, mode)
+                
+                # 计算处理时间
+                processing_time = time.time() - start_time
+                
+                # 添加处理信息
+                if isinstance(result, dict):
+                    result['processing_time'] = round(processing_time, 2)
+                    result['attempt'] = attempt + 1
+                
+                logger.info(f"成功处理文件: {basename} (耗时: {processing_time:.2f}s)")
+                return result
+                
+            except Exception as e:
+                error_msg = str(e)
+                logger.warning(f"处理文件失败 (尝试 {attempt + 1}/{self.config.retry_attempts}): {basename} - {error_msg}")
+
+                if attempt < self.config.retry_attempts - 1:
+                    # 指数退避重试
+                    wait_time = self.config.retry_delay * (2 ** attempt)
+                    logger.info(f"等待 {wait_time:.1f} 秒后重试...")
+                    await asyncio.sleep(wait_time)
+                else:
+                    # 最后一次尝试失败，返回详细错误结果
+                    error_details = {
+                        'file': file_path,
+                        'filename': stem,
+                        'error': error_msg,
+                        'status': 'failed',
+                        'attempts': self.config.retry_attempts,
+                        'error_type': type(e).__name__,
+                        'processing_time': time.time() - start_time
+                    }
+
+                    # 提供更具体的错误分类
+                    error_details['error_category'] = next(
+                        (cat for needle, cat in _ERR_TAGS if needle in error_msg), 'processing')
+
+                    return error_details
 
     async def process_single_file_with_index(self, file_path: str, process_func: Callable, mode: str, original_index: int) -> Dict[str, Any]:
         """处理单个文件并保留原始索引"""
@@ -179,6 +237,64 @@ class ConcurrentProcessor:
 
         return result
 
+    @staticmethod
+    def _exception_result(file_path: str, index: int, exc: BaseException) -> Dict[str, Any]:
+        """把任务抛出的异常转换为失败记录"""
+        filename = os.path.basename(file_path)
+        # 去掉.pdf扩展名
+        if filename.lower().endswith('.pdf'):
+            filename = filename[:-4]
+
+        logger.error(f"文件处理异常: {filename} - {str(exc)}")
+        return {
+            'file': file_path,
+            'filename': filename,
+            'error': str(exc),
+            'status': 'failed',
+            '_original_index': index,
+            '_upload_order': index + 1
+        }
+
+    async def _iter_raw(self, file_paths: List[str], process_func: Callable,
+                        mode: str) -> AsyncIterator[Tuple[int, Union[Dict[str, Any], BaseException]]]:
+        """
+        按完成顺序产出 (原始索引, 结果或异常)。
+        任务按需创建，同时存在的任务数不超过 max_concurrent，内存占用与批量大小无关；
+        跨批次的全局并发上限由 process_single_file 中的信号量保证。
+        """
+        limit = max(1, self.config.max_concurrent)
+        pending: Dict[asyncio.Future, int] = {}
+        items = enumerate(file_paths)
+
+        def _fill():
+            for i, file_path in items:
+                task = asyncio.ensure_future(self.process_single_file_with_index(file_path, process_func, mode, i))
+                pending[task] = i
+                if len(pending) >= limit:
+                    break
+
+        _fill()
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    i = pending.pop(task)
+                    exc = task.exception()
+                    yield i, (exc if exc is not None else task.result())
+                _fill()
+        finally:
+            # 调用方提前退出时取消尚未完成的任务
+            for task in pending:
+                task.cancel()
+
+    async def iter_batch(self, file_paths: List[str], process_func: Callable,
+                         mode: str) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """流式批量处理：按完成顺序产出 (原始索引, 结果)，异常已转换为失败记录"""
+        async for i, result in self._iter_raw(file_paths, process_func, mode):
+            if isinstance(result, BaseException):
+                result = self._exception_result(file_paths[i], i, result)
+            yield i, result
+
     async def process_batch(self, file_paths: List[str], process_func: Callable, mode: str,
                           progress_callback: Optional[Callable] = None) -> List[Dict[str, Any]]:
         """批量处理文件 - 全并发模式"""
@@ -188,17 +304,23 @@ class ConcurrentProcessor:
         # 记录输入文件列表（用于调试）
         logger.debug(f"输入文件列表: {[os.path.basename(f) for f in file_paths[:10]]}{'...' if len(file_paths) > 10 else ''}")
 
-        # 创建所有任务，全部并发执行，并保存原始索引
-        tasks = []
-        for i, file_path in enumerate(file_paths):
-            task = self.process_single_file_with_index(file_path, process_func, mode, i)
-            tasks.append(task)
-
-        logger.info(f"启动 {len(tasks)} 个并发任务...")
+        logger.info(f"启动 {total_files} 个并发任务（按需创建）...")
 
-        # 全部并发执行
+        # 并发执行，按原始索引回填结果，每完成一个即上报进度
+        results: List[Any] = [None] * total_files
+        done = successful = exception_count = 0
         try:
-            results = await asyncio.gather(*tasks, return_exceptions=True)
+            async for i, result in self._iter_raw(file_paths, process_func, mode):
+                # 异常结果就地转换为失败记录，成功/失败随到随计
+                if isinstance(result, BaseException):
+                    exception_count += 1
+                    result = self._exception_result(file_paths[i], i, result)
+                elif result.get('status') != 'failed' and 'error' not in result:
+                    successful += 1
+                results[i] = result
+                done += 1
+                if progress_callback and done < total_files:
+                    await progress_callback(done * 100 / total_files, f"已处理 {done}/{total_files}")
         except Exception as e:
             logger.error(f"批量处理过程中发生严重错误: {e}")
             # 创建失败结果
@@ -221,35 +343,11 @@ class ConcurrentProcessor:
         if len(results) != total_files:
             logger.error(f"❌ 结果数量不匹配！期望: {total_files}, 实际: {len(results)}")
 
-        # 处理异常结果
-        exception_count = 0
-        for i, result in enumerate(results):
-            if isinstance(result, Exception):
-                exception_count += 1
-                filename = os.path.basename(file_paths[i])
-                # 去掉.pdf扩展名
-                if filename.lower().endswith('.pdf'):
-                    filename = filename[:-4]
-
-                logger.error(f"文件处理异常: {filename} - {str(result)}")
-                results[i] = {
-                    'file': file_paths[i],
-                    'filename': filename,
-                    'error': str(result),
-                    'status': 'failed',
-                    '_original_index': i,
-                    '_upload_order': i + 1
-                }
-
         if exception_count > 0:
             logger.warning(f"发现 {exception_count} 个异常结果已转换为失败记录")
 
-        # 按照原始索引重新排序，确保返回顺序与上传顺序一致
-        results.sort(key=lambda x: x.get('_original_index', 0))
-
         # 统计结果
-        successful = sum(1 for r in results if r.get('status') != 'failed' and 'error' not in r)
-        failed = len(results) - successful
+        failed = done - successful
 
         logger.info(f"全并发处理完成: 成功 {successful}, 失败 {failed}, 总计 {total_files}")
 
@@ -265,53 +363,44 @@ class ConcurrentProcessor:
     
     def get_processing_stats(self) -> Dict[str, Any]:
         """获取处理统计信息"""
-        with self.rate_limiter.lock:
-            current_time = time.time()
-
-            # 计算最近1分钟与最近1秒的请求数
-            recent_requests_min = sum(1 for t in self.rate_limiter.request_times
-                                    if current_time - t <= 60)
-            recent_requests_sec = sum(1 for t in self.rate_limiter.second_request_times
-                                    if current_time - t <= 1)
-
-            # 计算最近1分钟的token使用量
-            recent_tokens = sum(usage[1] for usage in self.rate_limiter.token_usage
-                                if current_time - usage[0] <= 60)
-
-            return {
-                'recent_requests_per_second': recent_requests_sec,
-                'recent_requests_per_minute': recent_requests_min,
-                'recent_tokens_per_minute': recent_tokens,
-                'rps_limit': getattr(self.config, 'rps', None),
-                'rpm_limit': self.config.rpm,
-                'tpm_limit': self.config.tpm,
-                'rpm_usage_percent': (recent_requests_min / self.config.rpm) * 100,
-                'tpm_usage_percent': (recent_tokens / self.config.tpm) * 100,
-                'max_concurrent': self.config.max_concurrent,
-                'current_concurrent': self.config.max_concurrent - self.semaphore._value
-            }
+        limiter = self.rate_limiter
+        with limiter.lock:
+            # 先清理过期记录，窗口内剩余的条数即为最近1秒/1分钟的请求数
+            limiter._expire(time.time())
+            recent_requests_min = len(limiter.request_times)
+            recent_requests_sec = len(limiter.second_request_times)
+            # 最近1分钟的token使用量（增量维护）
+            recent_tokens = limiter._token_sum
+
+        return {
+            'recent_requests_per_second': recent_requests_sec,
+            'recent_requests_per_minute': recent_requests_min,
+            'recent_tokens_per_minute': recent_tokens,
+            'rps_limit': self.config.rps,
+            'rpm_limit': self.config.rpm,
+            'tpm_limit': self.config.tpm,
+            'rpm_usage_percent': (recent_requests_min / self.config.rpm) * 100,
+            'tpm_usage_percent': (recent_tokens / self.config.tpm) * 100,
+            'max_concurrent': self.config.max_concurrent,
+            'current_concurrent': self._inflight
+        }
 
 # 全局处理器实例
-_global_processor = None
-
+@functools.cache
 def get_global_processor() -> ConcurrentProcessor:
-    """获取全局处理器实例"""
-    global _global_processor
-    if _global_processor is None:
-        # 受控限流配置：RPS≤50，RPM≤5000，并发≤50；一次最多300个文件
-        config = RateLimitConfig(
-            rps=50,
-            rpm=5000,
-            tpm=20000000,
-            max_concurrent=50,
-            batch_size=300,
-            retry_attempts=3,
-            retry_delay=1.0
-        )
-        _global_processor = ConcurrentProcessor(config)
-    return _global_processor
+    """获取全局处理器实例（首次调用时创建）"""
+    # 受控限流配置：RPS≤50，RPM≤5000，并发≤50；一次最多300个文件
+    config = RateLimitConfig(
+        rps=50,
+        rpm=5000,
+        tpm=20000000,
+        max_concurrent=50,
+        batch_size=300,
+        retry_attempts=3,
+        retry_delay=1.0
+    )
+    return ConcurrentProcessor(config)
 
 def reset_global_processor():
     """重置全局处理器（用于测试）"""
-    global _global_processor
-    _global_processor = None
+    get_global_processor.cache_clear()
@@ -29,10 +29,21 @@ class Config:
     LLM_MODEL = os.environ.get('LLM_MODEL') or "qwen-plus"
     LLM_MAX_TOKENS = int(os.environ.get('LLM_MAX_TOKENS', '4000'))
     LLM_TEMPERATURE = float(os.environ.get('LLM_TEMPERATURE', '0.1'))
+    LLM_MAX_OUTPUT_TOKENS = int(os.environ.get('LLM_MAX_OUTPUT_TOKENS', '8192'))  # 模型单次输出 tokens 上限（qwen-plus 为 8192），批量请求的 max_tokens 不超过该值
+    LLM_BATCH_SIZE = int(os.environ.get('LLM_BATCH_SIZE', '1'))  # 同时到达的请求最多合并几篇为一次LLM调用，1 表示不合并（受输出上限约束）
+    LLM_BATCH_WAIT = float(os.environ.get('LLM_BATCH_WAIT', '0.05'))  # 合并请求的等待时间窗（秒）
+    LLM_MAX_INPUT_CHARS = int(os.environ.get('LLM_MAX_INPUT_CHARS', '12000'))  # 单篇输入文本截断长度，0 表示不截断
+    LLM_MAX_CONNECTIONS = int(os.environ.get('LLM_MAX_CONNECTIONS', '64'))  # 连接池上限，应不小于并发数
+    META_CACHE_SIZE = int(os.environ.get('META_CACHE_SIZE', '1024'))  # 按内容哈希缓存的提取结果条数
+    PDF_WORKERS = int(os.environ.get('PDF_WORKERS') or os.cpu_count() or 1)  # PDF解析进程数
+    CACHE_FOLDER = os.environ.get('CACHE_FOLDER', 'cache')  # 内部缓存目录（不在用户可见的上传目录内）
+    META_CACHE_FILE = os.environ.get('META_CACHE_FILE', os.path.join(CACHE_FOLDER, 'meta_cache.jsonl'))  # 提取结果持久化缓存文件，置空则不落盘
+    META_CACHE_FILE_SIZE = int(os.environ.get('META_CACHE_FILE_SIZE', '10000'))  # 持久化缓存保留的最近条数
     
     # 日志配置
     LOG_LEVEL = os.environ.get('LOG_LEVEL') or 'INFO'
     LOG_FILE = 'pdf_extraction.log'
+    LOG_CONSOLE_SUCCESS = os.environ.get('LOG_CONSOLE_SUCCESS', '').lower() in ('1', 'true', 'yes')  # 是否在控制台打印成功操作的调试信息（失败信息总会打印）
     
     @classmethod
     def init_app(cls, app):
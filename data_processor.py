@@ -5,12 +5,42 @@
 """
 
 import os
+import re
 import asyncio
+from functools import lru_cache
 from typing import Dict, List, Any, Optional
 from dataclasses import asdict
 
 # 导入现有的元数据提取模块
-from Metadata import extract_first_page_llm, PaperMeta, extract_acknowledgment_from_last_pages
+from Metadata import extract_first_page_llm, PaperMeta, extract_acknowledgment_async
+
+
+# 导出时需要移除的内部字段
+_INTERNAL_FIELDS = frozenset({
+    '_original_index',
+    '_upload_order',
+    'attempt',
+    'processing_time',
+    'filename',  # 移除通用filename字段
+    'file',      # 移除文件路径字段
+    'status',    # 移除状态字段（仅保留有错误的记录中的error字段）
+    'tokens_used'  # 不对外展示tokens统计
+})
+
+# 支持的处理模式
+SUPPORTED_MODES = frozenset({'sn', 'ieee', 'funding', 'ap'})
+
+# 上传时加在文件名前的 UUID 前缀（8-4-4-4-12 个十六进制字符 + 下划线）
+_UUID_PREFIX_RE = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}_')
+
+
+@lru_cache(maxsize=4096)
+def _real_filename(file_path: str) -> str:
+    """按路径缓存的真实文件名解析，同一文件的格式化与错误分支只解析一次"""
+    # 格式：UUID_真实文件名.pdf
+    filename = _UUID_PREFIX_RE.sub('', os.path.basename(file_path), count=1)
+    # 去掉.pdf扩展名
+    return filename[:-4] if filename.lower().endswith('.pdf') else filename
 
 
 class BaseProcessor:
@@ -21,37 +51,10 @@ class BaseProcessor:
     
     def _extract_real_filename(self, file_path: str) -> str:
         """从文件路径中提取真实的文件名（去掉UUID前缀和.pdf扩展名）"""
-        filename = os.path.basename(file_path)
-        if '_' in filename:
-            # 检查第一部分是否是UUID格式（8-4-4-4-12个字符）
-            parts = filename.split('_', 1)
-            if len(parts) == 2:
-                potential_uuid = parts[0]
-                # 简单的UUID格式检查：长度为36且包含4个连字符
-                if len(potential_uuid) == 36 and potential_uuid.count('-') == 4:
-                    # 格式：UUID_真实文件名.pdf
-                    filename = parts[1]
-
-        # 去掉.pdf扩展名
-        if filename.lower().endswith('.pdf'):
-            filename = filename[:-4]
-
-        return filename
+        return _real_filename(file_path)
 
     def _clean_export_data(self, data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """清理导出数据，移除内部处理字段"""
-        # 需要移除的内部字段
-        internal_fields = {
-            '_original_index',
-            '_upload_order',
-            'attempt',
-            'processing_time',
-            'filename',  # 移除通用filename字段
-            'file',      # 移除文件路径字段
-            'status',    # 移除状态字段（仅保留有错误的记录中的error字段）
-            'tokens_used'  # 不对外展示tokens统计
-        }
-
         cleaned_data = []
         for item in data:
             # 跳过有错误的记录
@@ -59,49 +62,56 @@ class BaseProcessor:
                 continue
 
             # 创建清理后的记录
-            cleaned_item = {}
-            for key, value in item.items():
-                if key not in internal_fields:
-                    cleaned_item[key] = value
-
-            cleaned_data.append(cleaned_item)
+            cleaned_data.append({key: value for key, value in item.items() if key not in _INTERNAL_FIELDS})
 
         return cleaned_data
 
-    def _get_author_affiliation(self, author, affiliations) -> str:
-        """获取作者单位"""
+    @staticmethod
+    def _aff_index(affiliations) -> Dict[Any, str]:
+        """单位 id -> 单位名称，id 重复时保留第一个（与逐个查找的结果一致）"""
+        return {aff.id: aff.name for aff in reversed(affiliations)}
+
+    def _get_author_affiliation(self, author, aff_by_id: Dict[Any, str]) -> str:
+        """获取作者单位（aff_by_id 由 _aff_index 构建，取第一个匹配的单位）"""
         if not author or not author.affiliation_ids:
             return ''
-        
-        for aff_id in author.affiliation_ids:
-            aff = next((aff for aff in affiliations if aff.id == aff_id), None)
-            if aff:
-                return aff.name
-        return ''
+        return next((aff_by_id[aff_id] for aff_id in author.affiliation_ids if aff_id in aff_by_id), '')
 
 
 class ComplexProcessor(BaseProcessor):
     """复杂处理器 - 用于IEEE和FUNDING模式，保持现有的复杂双栏判定处理逻辑"""
+
+    def __init__(self):
+        super().__init__()
+        # 模式 -> 格式化函数，初始化时构建一次
+        self._formatters = {
+            'ieee': self._format_ieee_data,
+            'funding': self._format_funding_data,
+        }
     
     async def process_file(self, file_path: str, mode: str) -> Dict[str, Any]:
         """处理单个PDF文件 - 复杂模式（IEEE/FUNDING）"""
+        # 资助模式的致谢提取与首页LLM调用互不依赖，交给PDF解析池与LLM请求重叠执行
+        ack_task = asyncio.ensure_future(self._extract_acknowledgment(file_path)) if mode == 'funding' else None
         try:
             # 调用现有的元数据提取函数，传递mode参数以使用对应的提示词
             meta, tokens_used = await extract_first_page_llm(file_path, mode)
             
-            # 根据模式转换数据格式
-            if mode == 'ieee':
-                result = self._format_ieee_data(meta, file_path)
-            elif mode == 'funding':
-                result = self._format_funding_data(meta, file_path)
-            else:
-                raise ValueError(f"ComplexProcessor不支持的模式: {mode}")
+            # 根据模式转换数据格式（资助模式额外传入致谢信息）
+            try:
+                fmt = self._formatters[mode]
+            except KeyError:
+                raise ValueError(f"ComplexProcessor不支持的模式: {mode}") from None
+            extra = (await ack_task,) if ack_task is not None else ()
+            result = fmt(meta, file_path, *extra)
             
             # 添加tokens使用信息
             result['tokens_used'] = tokens_used
             return result
                 
         except Exception as e:
+            if ack_task is not None:
+                ack_task.cancel()
             filename = self._extract_real_filename(file_path)
             return {
                 'error': str(e),
@@ -120,15 +130,11 @@ class ComplexProcessor(BaseProcessor):
         all_authors = ', '.join([author.name for author in meta.authors])
 
         # 获取第一作者邮箱，如果没有则取通讯作者邮箱
-        first_author_email = ''
-        if meta.authors:
-            first_author_email = meta.authors[0].email or ''
-            if not first_author_email:
-                # 查找通讯作者邮箱
-                for author in meta.authors:
-                    if author.is_corresponding_author and author.email:
-                        first_author_email = author.email
-                        break
+        first_author_email = (meta.authors[0].email or '') if meta.authors else ''
+        if not first_author_email:
+            # 查找通讯作者邮箱（找到即停）
+            first_author_email = next(
+                (author.email for author in meta.authors if author.is_corresponding_author and author.email), '')
 
         # 获取去掉.pdf扩展名的文件名
         filename = self._extract_real_filename(file_path)
@@ -143,7 +149,16 @@ class ComplexProcessor(BaseProcessor):
             'filename': filename  # 添加通用filename字段（用于内部处理）
         }
     
-    def _format_funding_data(self, meta: PaperMeta, file_path: str) -> Dict[str, Any]:
+    @staticmethod
+    async def _extract_acknowledgment(file_path: str) -> str:
+        """提取致谢信息，失败时返回空字符串"""
+        try:
+            return await extract_acknowledgment_async(file_path)
+        except Exception as e:
+            print(f"致谢信息提取失败: {e}")
+            return ""
+
+    def _format_funding_data(self, meta: PaperMeta, file_path: str, acknowledgment: str = "") -> Dict[str, Any]:
         """格式化资助信息模式数据 - 保持复杂处理逻辑"""
         first_author = meta.authors[0] if meta.authors else None
         corresponding_author = next(
@@ -151,21 +166,15 @@ class ComplexProcessor(BaseProcessor):
             first_author
         )
 
-        # 提取致谢信息
-        acknowledgment = ""
-        try:
-            acknowledgment = extract_acknowledgment_from_last_pages(file_path)
-        except Exception as e:
-            print(f"致谢信息提取失败: {e}")
-
         filename = self._extract_real_filename(file_path)
+        aff_by_id = self._aff_index(meta.affiliations)
         return {
             '文件名': filename,
             '论文英文题目': meta.title,
             '第一作者姓名': first_author.name if first_author else '',
-            '第一作者单位': self._get_author_affiliation(first_author, meta.affiliations) if first_author else '',
+            '第一作者单位': self._get_author_affiliation(first_author, aff_by_id) if first_author else '',
             '通讯作者姓名': corresponding_author.name if corresponding_author else '',
-            '通讯作者单位': self._get_author_affiliation(corresponding_author, meta.affiliations) if corresponding_author else '',
+            '通讯作者单位': self._get_author_affiliation(corresponding_author, aff_by_id) if corresponding_author else '',
             '通讯作者邮箱': corresponding_author.email if corresponding_author else '',
             '关键词': ', '.join(meta.keywords),
             '摘要': meta.abstract or '',
@@ -176,6 +185,14 @@ class ComplexProcessor(BaseProcessor):
 
 class SimpleProcessor(BaseProcessor):
     """简化处理器 - 用于SN和AP模式，不需要复杂的双栏判定功能"""
+
+    def __init__(self):
+        super().__init__()
+        # 模式 -> 格式化函数，初始化时构建一次
+        self._formatters = {
+            'sn': self._format_sn_data,
+            'ap': self._format_ap_data,
+        }
     
     async def process_file(self, file_path: str, mode: str) -> Dict[str, Any]:
         """处理单个PDF文件 - 简化模式（SN/AP）"""
@@ -184,12 +201,11 @@ class SimpleProcessor(BaseProcessor):
             meta, tokens_used = await extract_first_page_llm(file_path, mode)
             
             # 根据模式转换数据格式
-            if mode == 'sn':
-                result = self._format_sn_data(meta, file_path)
-            elif mode == 'ap':
-                result = self._format_ap_data(meta, file_path)
-            else:
-                raise ValueError(f"SimpleProcessor不支持的模式: {mode}")
+            try:
+                fmt = self._formatters[mode]
+            except KeyError:
+                raise ValueError(f"SimpleProcessor不支持的模式: {mode}") from None
+            result = fmt(meta, file_path)
             
             # 添加tokens使用信息
             result['tokens_used'] = tokens_used
@@ -225,20 +241,12 @@ class SimpleProcessor(BaseProcessor):
         }
 
         # 动态生成作者和单位字段
+        aff_by_id = self._aff_index(meta.affiliations)
         for i, author in enumerate(meta.authors, 1):
             result[f'Author {i}'] = author.name
 
-            # 为每个作者生成对应的单位字段
-            affiliation_name = ''
-            if author.affiliation_ids:
-                # 获取第一个匹配的单位
-                for aff_id in author.affiliation_ids:
-                    aff = next((aff for aff in meta.affiliations if aff.id == aff_id), None)
-                    if aff:
-                        affiliation_name = aff.name
-                        break
-
-            result[f'Affiliation {i}'] = affiliation_name
+            # 为每个作者生成对应的单位字段（取第一个匹配的单位）
+            result[f'Affiliation {i}'] = self._get_author_affiliation(author, aff_by_id)
 
             # 识别通讯作者
             if author.is_corresponding_author:
@@ -301,17 +309,21 @@ class MetadataProcessor:
         self.complex_processor = ComplexProcessor()  # IEEE和FUNDING模式
         self.simple_processor = SimpleProcessor()    # SN和AP模式
         self.processing_tasks = {}
+        # 模式 -> 处理器：IEEE/FUNDING 使用复杂处理器（保持双栏判定逻辑），SN/AP 使用简化处理器
+        self._processors = {
+            'ieee': self.complex_processor,
+            'funding': self.complex_processor,
+            'sn': self.simple_processor,
+            'ap': self.simple_processor,
+        }
     
     async def process_file(self, file_path: str, mode: str) -> Dict[str, Any]:
         """处理单个PDF文件 - 根据模式选择处理器"""
-        if mode in ['ieee', 'funding']:
-            # 使用复杂处理器（保持现有的复杂双栏判定处理逻辑）
-            return await self.complex_processor.process_file(file_path, mode)
-        elif mode in ['sn', 'ap']:
-            # 使用简化处理器（不需要复杂的双栏判定功能）
-            return await self.simple_processor.process_file(file_path, mode)
-        else:
-            raise ValueError(f"不支持的模式: {mode}")
+        try:
+            processor = self._processors[mode]
+        except KeyError:
+            raise ValueError(f"不支持的模式: {mode}") from None
+        return await processor.process_file(file_path, mode)
     
     def _clean_export_data(self, data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """清理导出数据，移除内部处理字段"""
@@ -5,13 +5,74 @@
 """
 
 import os
+import sys
+import atexit
+import queue
 import logging
+import logging.handlers
 import time
-from datetime import datetime
+import threading
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
+from array import array
 from flask import request, g
-import json
+
+from config import Config
+
+__all__ = (
+    'BufferedFileHandler', 'LogManager', 'log_manager',
+    'log_operation', 'start_upload_session', 'end_upload_session', 'log_file_upload',
+    'add_tokens_to_session', 'update_session_mode', 'log_file_processing',
+    'log_batch_processing', 'log_api_call',
+)
+
+class BufferedFileHandler(logging.FileHandler):
+    """带64KB写缓冲的文件handler：普通记录只进缓冲区，ERROR及以上、带 flush 标记的记录或显式 flush 时才落盘"""
+
+    def _open(self):
+        return open(self.baseFilename, self.mode, buffering=65536, encoding=self.encoding)
+
+    def emit(self, record):
+        if self.stream is None:
+            self.stream = self._open()
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+            if record.levelno >= logging.ERROR or getattr(record, 'flush', False):
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+
+# IP地址中不适合出现在文件名里的字符（IPv4的点、IPv6的冒号）统一替换为下划线
+_IP_TABLE = str.maketrans('.:', '__')
+
+
+def _no_caller(*args, **kwargs):
+    """会话日志格式只用 %(message)s，不需要遍历调用栈定位调用者"""
+    return "(unknown file)", 0, "(unknown function)", None
+
+
+class _RoutingHandler(logging.Handler):
+    """在后台监听线程中按 logger 名把记录分发给对应的文件handler"""
+
+    def __init__(self):
+        super().__init__()
+        self.routes: Dict[str, logging.Handler] = {}
+
+    def handle(self, record):
+        # 带 close 标记的记录是该文件的最后一条：写完即关闭文件并移除路由
+        closing = getattr(record, 'close', False)
+        handler = self.routes.pop(record.name, None) if closing else self.routes.get(record.name)
+        if handler is not None:
+            handler.handle(record)
+            if closing:
+                handler.close()
+        return handler is not None
+
+    def flush(self):
+        for handler in list(self.routes.values()):
+            handler.flush()
+
 
 class LogManager:
     """日志管理器"""
@@ -20,7 +81,14 @@ class LogManager:
         self.log_dir = Path(log_dir)
         self.log_dir.mkdir(exist_ok=True)
         self.loggers = {}  # 缓存logger实例
+        self._loggers_lock = threading.Lock()  # 只在创建logger时加锁
         self.session_logs = {}  # 会话级别的日志缓存
+        # 请求线程只把日志记录放进队列，由单个后台线程写文件
+        self._queue = queue.Queue(-1)
+        self._router = _RoutingHandler()
+        self._listener = logging.handlers.QueueListener(self._queue, self._router)
+        self._listener.start()
+        atexit.register(self.shutdown)  # 退出时写完队列并把各文件缓冲区写盘
         
     def _get_client_ip(self) -> str:
         """获取客户端IP地址"""
@@ -36,9 +104,9 @@ class LogManager:
     
     def _generate_log_filename(self, ip: str, session_id: str = None) -> str:
         """生成日志文件名：IP_YYYYMMDD_HHMMSS.log 或 IP_YYYYMMDD_HHMMSS_SESSION.log"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
         # 清理IP地址中的特殊字符
-        clean_ip = ip.replace('.', '_').replace(':', '_')
+        clean_ip = ip.translate(_IP_TABLE)
         if session_id:
             return f"{clean_ip}_{timestamp}_{session_id}.log"
         return f"{clean_ip}_{timestamp}.log"
@@ -46,45 +114,76 @@ class LogManager:
     def _get_session_id(self) -> str:
         """获取或生成会话ID"""
         if not hasattr(g, 'session_id'):
-            import uuid
-            g.session_id = str(uuid.uuid4())[:8]  # 使用短UUID作为会话ID
+            g.session_id = os.urandom(4).hex()  # 8位十六进制随机串作为会话ID
         return g.session_id
     
+    def _get_ctx(self) -> Tuple[str, str, str]:
+        """当前请求的 (IP, 会话ID, 会话key)，每个请求只解析一次并缓存在 g 上"""
+        ctx = getattr(g, '_log_ctx', None)
+        if ctx is None:
+            ip = self._get_client_ip()
+            session_id = self._get_session_id()
+            ctx = g._log_ctx = (ip, session_id, sys.intern(f"{ip}_{session_id}"))
+        return ctx
+
     def _get_logger(self, ip: str, session_id: str = None) -> logging.Logger:
         """获取指定IP的logger实例（合并日志文件）"""
         # 使用会话ID作为logger的key
         logger_key = f"{ip}_{session_id}" if session_id else ip
 
-        if logger_key in self.loggers:
-            return self.loggers[logger_key]
-
-        # 创建新的logger
-        logger = logging.getLogger(f"user_{logger_key}")
-        logger.setLevel(logging.INFO)
-
-        # 清除现有的handlers
-        logger.handlers.clear()
-
-        # 创建文件handler，写入到指定的日志文件
-        log_filename = self._generate_log_filename(ip, session_id)
-        log_filepath = self.log_dir / log_filename
-
-        file_handler = logging.FileHandler(log_filepath, mode='w', encoding='utf-8')
-        file_handler.setLevel(logging.INFO)
-
-        # 设置简单的格式，不包含时间戳等前缀
-        formatter = logging.Formatter('%(message)s')
-        file_handler.setFormatter(formatter)
-
-        logger.addHandler(file_handler)
-        logger.propagate = False
-
-        self.loggers[logger_key] = logger
-        return logger
+        # 命中缓存时只做一次字典查找，不加锁
+        logger = self.loggers.get(logger_key)
+        if logger is not None:
+            return logger
+
+        with self._loggers_lock:
+            # 加锁后再查一次，避免多个线程同时创建同一个logger
+            logger = self.loggers.get(logger_key)
+            if logger is not None:
+                return logger
+
+            # 创建新的logger
+            logger = logging.getLogger(f"user_{logger_key}")
+            logger.setLevel(logging.INFO)
+            logger.findCaller = _no_caller
+
+            if not logger.handlers:
+                # 创建文件handler，写入到指定的日志文件
+                log_filename = self._generate_log_filename(ip, session_id)
+                log_filepath = self.log_dir / log_filename
+
+                file_handler = BufferedFileHandler(log_filepath, mode='w', encoding='utf-8')
+                file_handler.setLevel(logging.INFO)
+
+                # 设置简单的格式，不包含时间戳等前缀
+                formatter = logging.Formatter('%(message)s')
+                file_handler.setFormatter(formatter)
+
+                # 真实的文件handler挂在后台监听线程上，logger 本身只挂队列handler
+                self._router.routes[logger.name] = file_handler
+                logger.addHandler(logging.handlers.QueueHandler(self._queue))
+            logger.propagate = False
+
+            self.loggers[logger_key] = logger
+            return logger
+
+    def flush_all(self):
+        """把所有文件handler的缓冲区写盘"""
+        self._router.flush()
+
+    def shutdown(self):
+        """停止后台写日志线程（会先写完队列中的记录），再把缓冲区写盘"""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+        self.flush_all()
     
     def log_operation(self, operation: str, details: Dict[str, Any] = None,
                      processing_time: float = None, status: str = "success", tokens_used: int = None):
         """记录操作日志（精简版）- 仅用于调试，不写入最终日志文件"""
+        # 成功操作的调试输出默认关闭，避免批量处理时每个文件都打印一行
+        if status == "success" and not Config.LOG_CONSOLE_SUCCESS:
+            return
         try:
             # 只在控制台输出调试信息，不写入日志文件
             if status == "success":
@@ -108,9 +207,7 @@ class LogManager:
     
     def start_upload_session(self, total_files: int, mode: str = None):
         """开始上传会话"""
-        ip = self._get_client_ip()
-        session_id = self._get_session_id()
-        session_key = f"{ip}_{session_id}"
+        ip, session_id, session_key = self._get_ctx()
 
         self.session_logs[session_key] = {
             "session_id": session_id,
@@ -118,9 +215,15 @@ class LogManager:
             "start_time": time.time(),
             "total_files": total_files,
             "mode": mode,
-            "uploaded_files": [],
-            "processed_files": [],
-            "errors": [],
+            # 按列存放（每个文件一行，各列下标对齐），避免每个文件分配一个小字典
+            "uploaded_filenames": [],
+            "uploaded_sizes": array('q'),
+            "upload_times": array('d'),
+            "processed_filenames": [],
+            "processing_times": array('d'),   # 未提供耗时记为 nan
+            "processed_total_tokens": 0,      # 各文件总tokens的累计值，随处理增量维护
+            "error_filenames": [],
+            "error_messages": [],
             "upload_tokens": 0, # 新增：记录上传tokens
             "processing_tokens": 0 # 新增：记录处理tokens
         }
@@ -136,17 +239,14 @@ class LogManager:
 
     def log_file_upload(self, filename: str, file_size: int, processing_time: float = None):
         """记录单个文件上传"""
-        ip = self._get_client_ip()
-        session_id = self._get_session_id()
-        session_key = f"{ip}_{session_id}"
+        ip, session_id, session_key = self._get_ctx()
 
         # 添加到会话记录
         if session_key in self.session_logs:
-            self.session_logs[session_key]["uploaded_files"].append({
-                "filename": filename,
-                "file_size": file_size,
-                "upload_time": time.time()
-            })
+            session_data = self.session_logs[session_key]
+            session_data["uploaded_filenames"].append(filename)
+            session_data["uploaded_sizes"].append(file_size)
+            session_data["upload_times"].append(time.time())
 
         # 记录详细的单个文件上传信息（仅控制台调试用）
         details = {
@@ -160,9 +260,7 @@ class LogManager:
 
     def add_tokens_to_session(self, upload_tokens: int = 0, processing_tokens: int = 0):
         """向当前会话添加tokens统计"""
-        ip = self._get_client_ip()
-        session_id = self._get_session_id()
-        session_key = f"{ip}_{session_id}"
+        ip, session_id, session_key = self._get_ctx()
 
         if session_key in self.session_logs:
             self.session_logs[session_key]["upload_tokens"] += upload_tokens
@@ -170,9 +268,7 @@ class LogManager:
 
     def update_session_mode(self, new_mode: str):
         """更新当前会话的处理模式，而不创建新会话"""
-        ip = self._get_client_ip()
-        session_id = self._get_session_id()
-        session_key = f"{ip}_{session_id}"
+        ip, session_id, session_key = self._get_ctx()
 
         if session_key in self.session_logs:
             self.session_logs[session_key]["mode"] = new_mode
@@ -185,29 +281,18 @@ class LogManager:
                           status: str = "success", error: str = None,
                           prompt_tokens: int = 0, completion_tokens: int = 0, total_tokens: int = 0):
         """记录单个文件处理（精简版）"""
-        ip = self._get_client_ip()
-        session_id = self._get_session_id()
-        session_key = f"{ip}_{session_id}"
+        ip, session_id, session_key = self._get_ctx()
 
         # 添加到会话记录（仅保留关键信息）
         if session_key in self.session_logs:
-            self.session_logs[session_key]["processed_files"].append({
-                "filename": filename,
-                "mode": mode,
-                "status": status,
-                "processing_time": processing_time,
-                "tokens_used": {
-                    "prompt": prompt_tokens,
-                    "completion": completion_tokens,
-                    "total": total_tokens
-                }
-            })
+            session_data = self.session_logs[session_key]
+            session_data["processed_filenames"].append(filename)
+            session_data["processing_times"].append(processing_time if processing_time is not None else float('nan'))
+            session_data["processed_total_tokens"] += total_tokens or 0
 
             if error:
-                self.session_logs[session_key]["errors"].append({
-                    "filename": filename,
-                    "error": error
-                })
+                session_data["error_filenames"].append(filename)
+                session_data["error_messages"].append(error)
 
         # 记录精简的处理信息
         details = {"error": error} if error else None
@@ -219,9 +304,7 @@ class LogManager:
     
     def end_upload_session(self, success_count: int = None, failed_count: int = None):
         """结束上传会话并记录完整日志（合并版）"""
-        ip = self._get_client_ip()
-        session_id = self._get_session_id()
-        session_key = f"{ip}_{session_id}"
+        ip, session_id, session_key = self._get_ctx()
 
         if session_key not in self.session_logs:
             return
@@ -231,9 +314,9 @@ class LogManager:
         total_time = end_time - session_data["start_time"]
 
         # 统计实际数据
-        actual_uploaded = len(session_data["uploaded_files"])
-        actual_processed = len(session_data["processed_files"])
-        actual_errors = len(session_data["errors"])
+        actual_uploaded = len(session_data["uploaded_filenames"])
+        actual_processed = len(session_data["processed_filenames"])
+        actual_errors = len(session_data["error_filenames"])
         actual_success = actual_processed - actual_errors
 
         # 使用传入的统计数据或实际统计数据
@@ -247,7 +330,7 @@ class LogManager:
         # 计算tokens统计
         upload_tokens = session_data.get("upload_tokens", 0)
         processing_tokens = session_data.get("processing_tokens", 0)
-        total_tokens_from_files = sum(file_info.get('tokens_used', {}).get('total', 0) for file_info in session_data["processed_files"])
+        total_tokens_from_files = session_data["processed_total_tokens"]
 
         # 如果没有单独记录上传和处理tokens，使用总tokens
         if upload_tokens == 0 and processing_tokens == 0 and total_tokens_from_files > 0:
@@ -257,43 +340,53 @@ class LogManager:
 
         total_tokens = upload_tokens + processing_tokens
 
-        # 写入完整的会话日志（按照期望格式）
-        logger.info("=== 文件处理会话日志 ===")
-        logger.info(f"会话ID: {session_id}")
-        logger.info(f"客户端IP: {ip}")
-        logger.info(f"开始时间: {datetime.fromtimestamp(session_data['start_time']).strftime('%Y-%m-%d %H:%M:%S')}")
-        logger.info(f"结束时间: {datetime.fromtimestamp(end_time).strftime('%Y-%m-%d %H:%M:%S')}")
-        logger.info(f"处理模式: {session_data['mode'] or '未指定'}")
-        logger.info(f"总耗时: {total_time:.2f}秒")
-        logger.info(f"处理模式: 文件上传")
-        logger.info(f"预期文件数: {total_files}")
-        logger.info(f"实际上传: {actual_uploaded}个文件")
-        logger.info(f"实际处理: {actual_processed}个文件")
-        logger.info(f"处理成功: {final_success}个文件")
-        logger.info(f"处理失败: {final_failed}个文件")
-        logger.info(f"成功率: {(final_success / total_files * 100) if total_files > 0 else 0:.2f}%")
-
+        # 拼装完整的会话日志（按照期望格式），最后一次性写入
+        report = (
+            f"=== 文件处理会话日志 ===\n"
+            f"会话ID: {session_id}\n"
+            f"客户端IP: {ip}\n"
+            f"开始时间: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(session_data['start_time']))}\n"
+            f"结束时间: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(end_time))}\n"
+            f"处理模式: {session_data['mode'] or '未指定'}\n"
+            f"总耗时: {total_time:.2f}秒\n"
+            f"处理模式: 文件上传\n"
+            f"预期文件数: {total_files}\n"
+            f"实际上传: {actual_uploaded}个文件\n"
+            f"实际处理: {actual_processed}个文件\n"
+            f"处理成功: {final_success}个文件\n"
+            f"处理失败: {final_failed}个文件\n"
+            f"成功率: {(final_success / total_files * 100) if total_files > 0 else 0:.2f}%"
+        )
         if total_tokens > 0:
-            logger.info(f"上传tokens: {upload_tokens}")
-            logger.info(f"处理tokens: {processing_tokens}")
-            logger.info(f"总tokens: {total_tokens}")
-
-        # 写入上传文件列表
-        if session_data["uploaded_files"]:
-            logger.info("")
-            logger.info("=== 上传文件列表 ===")
-            for i, file_info in enumerate(session_data["uploaded_files"], 1):
-                logger.info(f"{i:3d}. {file_info['filename']} ({file_info['file_size']} bytes)")
+            report += (
+                f"\n上传tokens: {upload_tokens}"
+                f"\n处理tokens: {processing_tokens}"
+                f"\n总tokens: {total_tokens}"
+            )
+        lines = [report]
+
+        # 上传文件列表
+        if actual_uploaded:
+            lines += ["", "=== 上传文件列表 ==="]
+            lines.extend(f"{i:3d}. {filename} ({file_size} bytes)"
+                         for i, (filename, file_size) in enumerate(
+                             zip(session_data["uploaded_filenames"], session_data["uploaded_sizes"]), 1))
 
         # 如果有失败的文件，列出失败信息
-        if session_data["errors"]:
-            logger.info("")
-            logger.info("=== 处理失败文件 ===")
-            for i, error_info in enumerate(session_data["errors"], 1):
-                logger.info(f"{i:3d}. {error_info['filename']}: {error_info['error']}")
+        if actual_errors:
+            lines += ["", "=== 处理失败文件 ==="]
+            lines.extend(f"{i:3d}. {filename}: {error}"
+                         for i, (filename, error) in enumerate(
+                             zip(session_data["error_filenames"], session_data["error_messages"]), 1))
+
+        # 会话日志到此写完，带上 close 标记让后台线程写入后立即关闭文件（关闭时落盘）
+        logger.info("\n".join(lines), extra={'close': True})
 
-        # 清理会话数据
+        # 清理会话数据；会话日志只在此写一次，文件由后台线程写完后关闭，logger 不再保留
         del self.session_logs[session_key]
+        with self._loggers_lock:
+            self.loggers.pop(session_key, None)
+        logger.handlers.clear()
 
         return None  # 不再返回文件名，因为只有一个日志文件
 
@@ -343,10 +436,12 @@ class LogManager:
             cutoff_time = current_time - (days * 24 * 60 * 60)
             
             deleted_count = 0
-            for log_file in self.log_dir.glob("*.log"):
-                if log_file.stat().st_mtime < cutoff_time:
-                    log_file.unlink()
-                    deleted_count += 1
+            # scandir 一次读出目录项，DirEntry 自带类型信息，只需对 .log 文件取 mtime
+            with os.scandir(self.log_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.log') and entry.is_file() and entry.stat().st_mtime < cutoff_time:
+                        os.unlink(entry.path)
+                        deleted_count += 1
             
             if deleted_count > 0:
                 print(f"清理了 {deleted_count} 个旧日志文件")
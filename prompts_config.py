@@ -5,6 +5,9 @@
 为每个模式单独定义LLM提示词，便于针对性调整
 """
 
+from functools import lru_cache
+
+
 class PromptsConfig:
     """各模式的提示词配置"""
 
@@ -210,6 +213,14 @@ class PromptsConfig:
 
         return mode_prompts.get(mode, cls.BASE_PROMPT)
 
+    @classmethod
+    @lru_cache(maxsize=None)
+    def get_prompt_parts(cls, mode: str) -> tuple:
+        """把提示词在 {text_content} 处拆成 (前缀, 后缀)，模板只格式化一次，之后直接拼接"""
+        marker = "\x00TEXT\x00"
+        prefix, suffix = cls.get_prompt_for_mode(mode).format(text_content=marker).split(marker, 1)
+        return prefix, suffix
+
     @classmethod
     def get_all_modes(cls) -> list:
         """获取所有支持的模式"""
@@ -4,9 +4,10 @@ PDF元数据提取系统 - Flask API路由
 专注于API接口定义，数据处理逻辑已分离到data_processor模块
 """
 
+import io
 import os
-import json
 import uuid
+import shutil
 import asyncio
 import time
 import logging
@@ -14,13 +15,15 @@ from datetime import datetime
 from typing import Dict, List, Any, Optional
 from pathlib import Path
 
-from flask import Flask, request, jsonify, Response, render_template, send_file
+from flask import Flask, request, jsonify, Response, render_template, send_file, stream_with_context
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import pandas as pd
+import orjson
 
 # 导入数据处理模块
-from data_processor import MetadataProcessor
+from data_processor import MetadataProcessor, SUPPORTED_MODES
+from Metadata import run_sync
 from concurrent_processor import get_global_processor, ConcurrentProcessor, RateLimitConfig
 from config import Config
 from log_manager import log_manager, log_operation, log_file_upload, log_file_processing, log_batch_processing, log_api_call, start_upload_session, end_upload_session, update_session_mode
@@ -47,6 +50,61 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+def _ndjson(obj) -> bytes:
+    """流式接口的一行 NDJSON（UTF-8 编码）"""
+    return orjson.dumps(obj) + b'\n'
+
+
+def _save_upload(file, file_path: str):
+    """
+    保存上传文件。大文件由 Werkzeug 暂存在磁盘临时文件中，用 os.sendfile 在内核内直接拷贝；
+    内存中的小文件或不支持 sendfile 时按1MB块拷贝（FileStorage.save 默认只有16KB）。
+    """
+    src = file.stream
+    start = src.tell()
+    size = src.seek(0, os.SEEK_END) - start
+    src.seek(start)
+    with open(file_path, 'wb') as dst:
+        # 只对大文件尝试 sendfile：对仍在内存里的 SpooledTemporaryFile 取 fileno 会先把它写到磁盘
+        if size >= (1 << 20) and hasattr(os, 'sendfile'):
+            try:
+                fd = src.fileno()
+                offset = start
+                while True:
+                    sent = os.sendfile(dst.fileno(), fd, offset, 1 << 30)
+                    if sent == 0:
+                        return
+                    offset += sent
+            except (AttributeError, OSError, io.UnsupportedOperation):
+                # 没有文件描述符（BytesIO）或内核不支持：回到起点改用普通拷贝
+                dst.seek(0)
+                dst.truncate()
+                src.seek(start)
+        shutil.copyfileobj(src, dst, 1 << 20)
+
+
+def _write_excel(df: pd.DataFrame, file_path: str):
+    """用 xlsxwriter 写出Excel（比 openpyxl 快）；不把字符串自动转成超链接，与原输出保持一致"""
+    with pd.ExcelWriter(file_path, engine='xlsxwriter',
+                        engine_kwargs={'options': {'strings_to_urls': False}}) as writer:
+        df.to_excel(writer, index=False)
+
+
+# 流式接口对外不展示的内部字段（并发处理器附加的调度信息与tokens统计）
+_STREAM_INTERNAL_FIELDS = frozenset({'tokens_used', 'processing_time', 'attempt', '_original_index', '_upload_order'})
+
+
+async def _process_files(file_paths: List[str], modes: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    按多个模式处理一组文件，返回 {模式: 结果列表}，每个列表顺序与 file_paths 一致。
+    各模式的批次可以重叠执行，但每个文件都经过全局并发处理器（限流 + 重试 + 全局并发上限）。
+    """
+    concurrent_processor = get_global_processor()
+    batches = await asyncio.gather(*[concurrent_processor.process_batch(file_paths, processor.process_file, mode)
+                                     for mode in modes])
+    return dict(zip(modes, batches))
+
 def allowed_file(filename):
     """检查文件扩展名"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
@@ -181,7 +239,7 @@ def upload_files():
                 file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{file_id}_{filename}")
 
                 logger.debug(f"保存文件: {filename} -> {file_path}")
-                file.save(file_path)
+                _save_upload(file, file_path)
 
                 # 验证文件是否成功保存
                 if not os.path.exists(file_path):
@@ -249,28 +307,31 @@ def list_files():
     """获取已上传文件列表"""
     try:
         files = []
-        upload_dir = Path(app.config['UPLOAD_FOLDER'])
-
-        for file_path in upload_dir.glob('*.pdf'):
-            stat = file_path.stat()
-            # 从文件名中提取真实文件名（去掉UUID前缀和.pdf扩展名）
-            full_filename = file_path.name
-            if '_' in full_filename:
-                # 格式：UUID_真实文件名.pdf
-                real_filename = '_'.join(full_filename.split('_')[1:])
-            else:
-                real_filename = full_filename
 
-            # 去掉.pdf扩展名
-            if real_filename.lower().endswith('.pdf'):
-                real_filename = real_filename[:-4]
-
-            files.append({
-                'filename': real_filename,  # 返回去掉.pdf扩展名的真实文件名
-                'full_filename': full_filename,  # 保留完整文件名用于删除等操作
-                'size': stat.st_size,
-                'upload_time': datetime.fromtimestamp(stat.st_ctime).isoformat()
-            })
+        # scandir 一次读出目录项，只对 PDF 文件取 stat，不为每个文件构造 Path 对象
+        with os.scandir(app.config['UPLOAD_FOLDER']) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.pdf') or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                # 从文件名中提取真实文件名（去掉UUID前缀和.pdf扩展名）
+                full_filename = entry.name
+                if '_' in full_filename:
+                    # 格式：UUID_真实文件名.pdf
+                    real_filename = full_filename.split('_', 1)[1]
+                else:
+                    real_filename = full_filename
+
+                # 去掉.pdf扩展名
+                if real_filename.lower().endswith('.pdf'):
+                    real_filename = real_filename[:-4]
+
+                files.append({
+                    'filename': real_filename,  # 返回去掉.pdf扩展名的真实文件名
+                    'full_filename': full_filename,  # 保留完整文件名用于删除等操作
+                    'size': stat.st_size,
+                    'upload_time': datetime.fromtimestamp(stat.st_ctime).isoformat()
+                })
 
         return jsonify({
             'files': files,
@@ -284,13 +345,14 @@ def list_files():
 def delete_file(file_id):
     """删除指定文件"""
     try:
-        upload_dir = Path(app.config['UPLOAD_FOLDER'])
-        file_pattern = f"{file_id}_*"
+        prefix = f"{file_id}_"
 
         deleted = False
-        for file_path in upload_dir.glob(file_pattern):
-            file_path.unlink()
-            deleted = True
+        with os.scandir(app.config['UPLOAD_FOLDER']) as entries:
+            for entry in entries:
+                if entry.name.startswith(prefix) and entry.is_file():
+                    os.unlink(entry.path)
+                    deleted = True
 
         if deleted:
             return jsonify({'success': True, 'message': '文件删除成功'})
@@ -304,7 +366,7 @@ def delete_file(file_id):
 def extract_metadata(mode):
     """单模式元数据提取接口（支持并发处理）"""
     try:
-        if mode not in ['sn', 'ieee', 'funding', 'ap']:
+        if mode not in SUPPORTED_MODES:
             return jsonify({'error': f'不支持的模式: {mode}'}), 400
 
         data = request.get_json()
@@ -357,15 +419,9 @@ def extract_metadata(mode):
         async def process_wrapper(file_path: str, mode: str):
             return await processor.process_file(file_path, mode)
 
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            results = loop.run_until_complete(
-                concurrent_processor.process_batch(valid_files, process_wrapper, mode)
-            )
-            # 并发处理器内部已经按原始索引排序，无需额外排序
-        finally:
-            loop.close()
+        # 在常驻后台事件循环上执行，HTTP连接池跨请求复用
+        results = run_sync(concurrent_processor.process_batch(valid_files, process_wrapper, mode))
+        # 并发处理器内部已经按原始索引回填，无需额外排序
 
         # 验证处理结果的完整性
         output_result_count = len(results)
@@ -427,7 +483,7 @@ def extract_batch_optimized():
         file_paths = data.get('file_paths', [])
         mode = data.get('mode', 'sn')
 
-        if mode not in ['sn', 'ieee', 'funding', 'ap']:
+        if mode not in SUPPORTED_MODES:
             return jsonify({'error': f'不支持的模式: {mode}'}), 400
 
         if not file_paths:
@@ -459,17 +515,9 @@ def extract_batch_optimized():
             progress_info['current'] = int(progress * len(valid_files) / 100)
             progress_info['message'] = message
 
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            start_time = time.time()
-            results = loop.run_until_complete(
-                concurrent_processor.process_batch(valid_files, process_wrapper, mode, progress_callback)
-            )
-            processing_time = time.time() - start_time
-
-        finally:
-            loop.close()
+        start_time = time.time()
+        results = run_sync(concurrent_processor.process_batch(valid_files, process_wrapper, mode, progress_callback))
+        processing_time = time.time() - start_time
 
         # 统计结果
         successful_count = len([r for r in results if r.get('status') != 'failed' and 'error' not in r])
@@ -525,35 +573,31 @@ def batch_extract():
         if not file_paths:
             return jsonify({'error': '没有指定文件路径'}), 400
 
+        modes = [mode for mode in dict.fromkeys(modes) if mode in SUPPORTED_MODES]
+        exists = [os.path.exists(file_path) for file_path in file_paths]
+        existing = [file_path for file_path, ok in zip(file_paths, exists) if ok]
+        # 各模式的批次在后台事件循环上重叠执行，共享全局处理器的限流与并发上限
+        processed = run_sync(_process_files(existing, modes))
+
         results = {}
         for mode in modes:
-            if mode not in ['sn', 'ieee', 'funding', 'ap']:
-                continue
-
+            mode_processed = iter(processed[mode])
             mode_results = []
-            for file_path in file_paths:
-                if not os.path.exists(file_path):
+            for file_path, ok in zip(file_paths, exists):
+                if not ok:
                     mode_results.append({
                         'file': file_path,
                         'error': '文件不存在',
                         'status': 'failed'
                     })
-                    continue
-
-                # 异步处理文件
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                try:
-                    result = loop.run_until_complete(processor.process_file(file_path, mode))
-                    mode_results.append(result)
-                finally:
-                    loop.close()
+                else:
+                    mode_results.append(next(mode_processed))
 
             results[mode] = mode_results
 
         return jsonify({
             'success': True,
-            'results': {m: [{k: v for k, v in r.items() if k != 'tokens_used'} for r in res] for m, res in results.items()},
+            'results': {m: [{k: v for k, v in r.items() if k not in _STREAM_INTERNAL_FIELDS} for r in res] for m, res in results.items()},
             'processed_modes': list(results.keys())
         })
 
@@ -573,16 +617,16 @@ def process_files():
 
             if not files:
                 log_operation("文件处理", {"error": "没有上传文件"}, time.time() - start_time, "error")
-                yield json.dumps({'type': 'error', 'message': '没有上传文件'}) + '\n'
+                yield _ndjson({'type': 'error', 'message': '没有上传文件'})
                 return
 
             # 记录开始处理日志
             log_operation("文件处理", {"file_count": len(files), "mode": mode})
 
-            yield json.dumps({
+            yield _ndjson({
                 'type': 'status',
                 'message': f'开始处理 {len(files)} 个文件，模式: {mode}'
-            }) + '\n'
+            })
 
             # 保存上传的文件
             saved_files = []
@@ -591,34 +635,38 @@ def process_files():
                     filename = secure_filename(file.filename)
                     file_id = str(uuid.uuid4())
                     file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{file_id}_{filename}")
-                    file.save(file_path)
+                    _save_upload(file, file_path)
                     saved_files.append(file_path)
 
-            yield json.dumps({
+            yield _ndjson({
                 'type': 'info',
                 'message': f'成功保存 {len(saved_files)} 个文件'
-            }) + '\n'
+            })
 
-            # 处理每个文件
+            # 所有文件交给全局并发处理器（限流 + 重试 + 有界并发），按完成顺序逐个推送结果
             success_count = 0
             failed_count = 0
 
-            for i, file_path in enumerate(saved_files, 1):
-                file_start_time = time.time()
-                # 提取真实文件名（去掉UUID前缀）
-                real_filename = processor._extract_real_filename(file_path)
+            yield _ndjson({
+                'type': 'status',
+                'message': f'正在并发处理 {len(saved_files)} 个文件'
+            })
 
-                yield json.dumps({
-                    'type': 'status',
-                    'message': f'正在处理第 {i}/{len(saved_files)} 个文件: {real_filename}'
-                }) + '\n'
+            async def process_wrapper(file_path: str, mode: str):
+                return await processor.process_file(file_path, mode)
+
+            # 异步迭代器在后台事件循环上推进；两次取值之间其余文件仍在并发处理
+            results = get_global_processor().iter_batch(saved_files, process_wrapper, mode)
+            try:
+                while True:
+                    try:
+                        index, result = run_sync(results.__anext__())
+                    except StopAsyncIteration:
+                        break
 
-                # 异步处理文件
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                try:
-                    result = loop.run_until_complete(processor.process_file(file_path, mode))
-                    file_processing_time = time.time() - file_start_time
+                    # 提取真实文件名（去掉UUID前缀）
+                    real_filename = processor._extract_real_filename(saved_files[index])
+                    file_processing_time = result.get('processing_time')
 
                     if 'error' not in result:
                         success_count += 1
@@ -628,48 +676,49 @@ def process_files():
                         log_file_processing(real_filename, mode, file_processing_time, "success", None, tokens_used)
 
                         # 去除对外不展示的内部字段
-                        public_result = {k: v for k, v in result.items() if k != 'tokens_used'}
+                        public_result = {k: v for k, v in result.items() if k not in _STREAM_INTERNAL_FIELDS}
 
-                        yield json.dumps({
+                        yield _ndjson({
                             'type': 'data_row',
                             'data': public_result
-                        }) + '\n'
+                        })
 
-                        yield json.dumps({
+                        yield _ndjson({
                             'type': 'success',
                             'message': f'✅ {real_filename} 处理完成'
-                        }) + '\n'
+                        })
                     else:
                         failed_count += 1
                         # 记录失败处理日志
                         log_file_processing(real_filename, mode, file_processing_time, "error", result["error"])
 
-                        yield json.dumps({
+                        yield _ndjson({
                             'type': 'error',
                             'message': f'❌ {real_filename} 处理失败: {result["error"]}'
-                        }) + '\n'
-
-                finally:
-                    loop.close()
+                        })
+            finally:
+                # 客户端提前断开时取消尚未完成的文件
+                run_sync(results.aclose())
 
             # 记录批量处理完成日志
             total_time = time.time() - start_time
             log_batch_processing(len(saved_files), mode, total_time, success_count, failed_count)
 
-            yield json.dumps({
+            yield _ndjson({
                 'type': 'status',
                 'message': '所有文件处理完成'
-            }) + '\n'
+            })
 
         except Exception as e:
             processing_time = time.time() - start_time
             log_operation("文件处理", {"error": str(e)}, processing_time, "error")
-            yield json.dumps({
+            yield _ndjson({
                 'type': 'error',
                 'message': f'处理过程中发生错误: {str(e)}'
-            }) + '\n'
+            })
 
-    return Response(generate(), mimetype='text/plain')
+    # 生成器在视图返回后才执行，需要保留请求上下文（读取上传文件、会话日志）
+    return Response(stream_with_context(generate()), mimetype='text/plain')
 
 @app.route('/api/export/excel', methods=['POST'])
 def export_excel():
@@ -732,7 +781,7 @@ def export_excel():
         file_path = os.path.join(app.config['RESULTS_FOLDER'], filename)
 
         # 保存Excel文件
-        df.to_excel(file_path, index=False, engine='openpyxl')
+        _write_excel(df, file_path)
 
         return send_file(
             file_path,
@@ -774,8 +823,7 @@ def export_json():
             'results': cleaned_results
         }
 
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(export_data, f, ensure_ascii=False, indent=2)
+        Path(file_path).write_bytes(orjson.dumps(export_data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
 
         return send_file(
             file_path,
@@ -871,7 +919,7 @@ def download_excel():
         file_path = os.path.join(app.config['RESULTS_FOLDER'], filename)
 
         # 保存Excel文件
-        df.to_excel(file_path, index=False, engine='openpyxl')
+        _write_excel(df, file_path)
 
         return send_file(
             file_path,
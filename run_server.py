@@ -15,9 +15,13 @@ def check_dependencies():
         'Flask-CORS': 'flask_cors',
         'pandas': 'pandas',
         'openpyxl': 'openpyxl',
+        'XlsxWriter': 'xlsxwriter',
         'PyMuPDF': 'fitz',
         'aiohttp': 'aiohttp',
-        'regex': 'regex'
+        'regex': 'regex',
+        'rapidfuzz': 'rapidfuzz',
+        'orjson': 'orjson',
+        'scipy': 'scipy'
     }
 
     missing_packages = []
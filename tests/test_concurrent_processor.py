@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""RateLimiter 限流与发送时刻预约的测试（使用可控时钟，不依赖真实时间）"""
+
+import asyncio
+import types
+
+import pytest
+
+import concurrent_processor as cp
+from concurrent_processor import RateLimitConfig, RateLimiter
+
+
+_real_sleep = asyncio.sleep
+
+
+class FakeClock:
+    """可控时钟：sleep 只记录请求的时长；advance=True 时同时把时钟往前拨"""
+
+    def __init__(self, now: float = 1000.0, advance: bool = False):
+        self.now = now
+        self.advance = advance
+        self.sleeps = []
+
+    def time(self) -> float:
+        return self.now
+
+    async def sleep(self, delay: float):
+        self.sleeps.append(delay)
+        if self.advance:
+            self.now += delay
+        await _real_sleep(0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = FakeClock()
+    monkeypatch.setattr(cp, "time", types.SimpleNamespace(time=c.time))
+    monkeypatch.setattr(asyncio, "sleep", c.sleep)
+    return c
+
+
+def _limiter(**kw) -> RateLimiter:
+    cfg = dict(rps=1000, rpm=1000000, tpm=10 ** 12)
+    cfg.update(kw)
+    return RateLimiter(RateLimitConfig(**cfg))
+
+
+def test_rps_window(clock):
+    limiter = _limiter(rps=5)
+    for _ in range(5):
+        limiter.record_request()
+    clock.now += 0.4
+    assert not limiter.can_make_request()
+    # 最早一条记录在 1 秒后移出窗口
+    assert limiter._retry_after() == pytest.approx(0.6)
+    clock.now += 0.61
+    assert limiter.can_make_request()
+    assert len(limiter.second_request_times) == 0
+
+
+def test_rpm_window_uses_90_percent_cap(clock):
+    limiter = _limiter(rpm=10)  # 90% 安全边距 -> 9 条
+    start = clock.now
+    for _ in range(8):
+        limiter.record_request()
+        clock.now += 2.0  # 间隔大于 1 秒，不触发 RPS
+    assert limiter.can_make_request()
+    limiter.record_request()
+    assert not limiter.can_make_request()
+    assert limiter._retry_after() == pytest.approx(start + 60 - clock.now)
+    clock.now = start + 60.01
+    assert limiter.can_make_request()
+
+
+def test_tpm_window_counts_estimated_tokens(clock):
+    limiter = _limiter(tpm=10000)  # 上限 9000
+    limiter.record_request(tokens_used=5000)
+    clock.now += 10
+    assert limiter._retry_after(estimated_tokens=1000) == 0
+    assert limiter._retry_after(estimated_tokens=5000) == pytest.approx(50)
+    clock.now += 50.01
+    assert limiter._retry_after(estimated_tokens=5000) == 0
+    assert limiter._token_sum == 0
+
+
+def test_concurrent_waiters_get_distinct_spaced_slots(clock):
+    limiter = _limiter(rps=10)  # 最小间隔 0.1 秒，安全间隔 0.12 秒
+    step = limiter.safe_request_interval
+    assert step == pytest.approx(0.12)
+
+    async def main():
+        await asyncio.gather(*[limiter.wait_for_rate_limit() for _ in range(4)])
+
+    asyncio.run(main())
+    # 时钟冻结：第一个立即放行，其余依次睡到各自预约的时刻
+    assert clock.sleeps == pytest.approx([step, 2 * step, 3 * step])
+    assert limiter._next_slot == pytest.approx(clock.now + 4 * step)
+
+
+def test_waiter_sleeps_until_window_frees(clock):
+    clock.advance = True
+    limiter = _limiter(rps=2)
+    limiter.record_request()
+    limiter.record_request()
+    clock.now += 0.5
+
+    asyncio.run(limiter.wait_for_rate_limit())
+    # 先睡到最早记录移出 1 秒窗口（多留 1ms），复查通过后预约到当前时刻，无需再睡
+    assert clock.sleeps == pytest.approx([0.501])
+    assert limiter._next_slot == pytest.approx(clock.now + limiter.safe_request_interval)
+
+
+def test_next_expiry_gates_expire(clock):
+    limiter = _limiter(rps=100)
+    t0 = clock.now
+    limiter.record_request(tokens_used=10)
+    assert limiter._next_expiry == pytest.approx(t0 + 1)
+
+    clock.now = t0 + 0.9
+    limiter.record_request(tokens_used=20)
+    # 新记录不会推迟最早的过期时刻
+    assert limiter._next_expiry == pytest.approx(t0 + 1)
+
+    # 未到过期时刻：直接返回，窗口不变
+    limiter._expire(t0 + 0.95)
+    assert len(limiter.second_request_times) == 2
+
+    # 过了最早的过期时刻：只清掉已过期的记录，并重新计算下一次过期时刻
+    limiter._expire(t0 + 1.2)
+    assert list(limiter.second_request_times) == [pytest.approx(t0 + 0.9)]
+    assert len(limiter.request_times) == 2
+    assert limiter._next_expiry == pytest.approx(t0 + 1.9)
+
+    limiter._expire(t0 + 2.0)
+    assert not limiter.second_request_times
+    assert limiter._next_expiry == pytest.approx(t0 + 60)
+
+    # 一分钟窗口过期后 token 累计同步扣减
+    limiter._expire(t0 + 60.5)
+    assert len(limiter.request_times) == 1
+    assert limiter._token_sum == 20
+    assert limiter._next_expiry == pytest.approx(t0 + 60.9)
+    limiter._expire(t0 + 60.85)
+    assert limiter._token_sum == 20
+    limiter._expire(t0 + 61.0)
+    assert limiter._token_sum == 0
+    assert limiter._next_expiry == float('inf')
+
+    # 窗口清空后的新记录重新设定过期时刻
+    clock.now = t0 + 70
+    limiter.record_request()
+    assert limiter._next_expiry == pytest.approx(t0 + 71)
+
+
+def test_processing_stats_drop_expired_records(clock):
+    processor = cp.ConcurrentProcessor(RateLimitConfig(rps=100, rpm=1000, tpm=100000))
+    processor.rate_limiter.record_request(tokens_used=300)
+    clock.now += 0.5
+    processor.rate_limiter.record_request(tokens_used=200)
+    clock.now += 0.7
+    stats = processor.get_processing_stats()
+    assert stats['recent_requests_per_second'] == 1
+    assert stats['recent_requests_per_minute'] == 2
+    assert stats['recent_tokens_per_minute'] == 500
+
+
+def _tracking_func(state):
+    """记录同时在处理中的文件数峰值"""
+    async def process(file_path, mode):
+        state['live'] += 1
+        state['peak'] = max(state['peak'], state['live'])
+        await asyncio.sleep(0.005)
+        state['live'] -= 1
+        return {'filename': file_path}
+    return process
+
+
+def _fast_processor(max_concurrent: int) -> cp.ConcurrentProcessor:
+    return cp.ConcurrentProcessor(RateLimitConfig(rps=10000, rpm=10 ** 7, max_concurrent=max_concurrent,
+                                                  retry_attempts=1))
+
+
+def test_concurrency_cap_shared_across_batches_and_direct_calls():
+    processor = _fast_processor(3)
+    state = {'live': 0, 'peak': 0}
+    func = _tracking_func(state)
+
+    async def main():
+        await asyncio.gather(
+            processor.process_batch([f"a{i}.pdf" for i in range(10)], func, 'sn'),
+            processor.process_batch([f"b{i}.pdf" for i in range(10)], func, 'sn'),
+            *[processor.process_single_file(f"c{i}.pdf", func, 'sn') for i in range(5)],
+        )
+
+    asyncio.run(main())
+    assert state['peak'] == 3
+    assert processor._inflight == 0
+
+
+def test_processor_usable_from_successive_event_loops():
+    # 信号量发生等待时会绑定事件循环；同一处理器在新的 asyncio.run 中仍应可用
+    processor = _fast_processor(1)
+    state = {'live': 0, 'peak': 0}
+    func = _tracking_func(state)
+
+    async def main():
+        return await asyncio.gather(*[processor.process_single_file(p, func, 'sn') for p in ("x.pdf", "y.pdf", "z.pdf")])
+
+    for _ in range(2):
+        results = asyncio.run(main())
+        assert [r['filename'] for r in results] == ["x.pdf", "y.pdf", "z.pdf"]
+    assert state['peak'] == 1
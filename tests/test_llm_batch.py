@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""多篇合并LLM请求（call_llm_api_batch）与逐篇回退的测试；_post_llm 被替换，不访问网络"""
+
+import asyncio
+import os
+import re
+import shutil
+
+import pytest
+
+import Metadata as M
+from config import Config
+
+SAMPLE_PDF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample.pdf")
+
+
+def _fake_meta(title: str) -> dict:
+    return {"title": title, "authors": [{"name": "Fang Wang", "order": 1}], "keywords": []}
+
+
+@pytest.fixture
+def no_cache(monkeypatch):
+    """关闭持久化缓存并清空内存缓存，保证每个用例都真正走到 LLM 调用"""
+    monkeypatch.setattr(Config, "META_CACHE_FILE", "")
+    caches = (M._META_CACHE, M._CTX_CACHE, M._LLM_CACHE)
+    for c in caches:
+        c.clear()
+    yield
+    for c in caches:
+        c.clear()
+
+
+@pytest.fixture
+def pdfs(tmp_path):
+    """内容字节不同（哈希不同）、文本相同的若干份样例PDF"""
+    paths = []
+    for n in range(3):
+        p = tmp_path / f"{n}.pdf"
+        shutil.copy(SAMPLE_PDF, p)
+        with open(p, "ab") as f:
+            f.write(b"%" + str(n).encode() * 8 + b"\n")
+        paths.append(str(p))
+    return paths
+
+
+def test_batch_payload_caps_max_tokens(monkeypatch):
+    sent = []
+
+    async def fake_post(session, payload, headers):
+        sent.append(payload)
+        return {"results": [_fake_meta("a"), _fake_meta("b"), _fake_meta("c")]}, 90
+
+    monkeypatch.setattr(M, "_post_llm", fake_post)
+    monkeypatch.setattr(Config, "LLM_MAX_TOKENS", 4000)
+    monkeypatch.setattr(Config, "LLM_MAX_OUTPUT_TOKENS", 8192)
+    results, tokens = asyncio.run(M.call_llm_api_batch(["x", "y", "z"], "sn", session=object()))
+
+    assert [r["title"] for r in results] == ["a", "b", "c"]
+    assert tokens == 90
+    # 3 × 4000 超过模型上限，按上限请求
+    assert sent[0]["max_tokens"] == 8192
+    assert sent[0]["model"] == Config.LLM_MODEL
+    content = sent[0]["messages"][0]["content"]
+    assert all(f"=== 文档 {k} ===" in content for k in (1, 2, 3))
+
+
+def test_batch_limit_fits_output_cap(monkeypatch):
+    monkeypatch.setattr(Config, "LLM_MAX_TOKENS", 4000)
+    monkeypatch.setattr(Config, "LLM_MAX_OUTPUT_TOKENS", 8192)
+    assert M._llm_batch_limit(8) == 2
+    assert M._llm_batch_limit(1) == 1
+    monkeypatch.setattr(Config, "LLM_MAX_TOKENS", 10000)
+    assert M._llm_batch_limit(8) == 1
+
+
+def test_batch_mismatch_and_failure_return_none(monkeypatch):
+    async def short_post(session, payload, headers):
+        return {"results": [_fake_meta("a")]}, 50
+
+    async def failing_post(session, payload, headers):
+        raise RuntimeError("API 400: max_tokens too large")
+
+    monkeypatch.setattr(M, "_post_llm", short_post)
+    assert asyncio.run(M.call_llm_api_batch(["x", "y"], "sn", session=object())) == ([None, None], 50)
+    monkeypatch.setattr(M, "_post_llm", failing_post)
+    assert asyncio.run(M.call_llm_api_batch(["x", "y"], "sn", session=object())) == ([None, None], 0)
+
+
+@pytest.fixture
+def batching(monkeypatch):
+    """开启请求合并：每批最多 2 篇"""
+    monkeypatch.setattr(Config, "LLM_MAX_TOKENS", 4000)
+    monkeypatch.setattr(Config, "LLM_MAX_OUTPUT_TOKENS", 8192)
+    monkeypatch.setattr(Config, "LLM_BATCH_SIZE", 2)
+    monkeypatch.setattr(Config, "LLM_BATCH_WAIT", 1.0)
+
+
+def _recording_post(calls, batch_reply):
+    """批量请求返回 batch_reply(篇数)，逐篇请求返回标题为 single 的结果"""
+    async def fake_post(session, payload, headers):
+        await asyncio.sleep(0)  # 让出事件循环，模拟网络等待
+        content = payload["messages"][0]["content"]
+        if "=== 文档 1 ===" in content:
+            n = len(re.findall(r"=== 文档 \d+ ===", content))
+            calls.append(("batch", n))
+            return batch_reply(n)
+        calls.append("single")
+        return _fake_meta("single"), 10
+    return fake_post
+
+
+def test_concurrent_requests_are_merged(monkeypatch, batching):
+    calls = []
+    monkeypatch.setattr(M, "_post_llm", _recording_post(
+        calls, lambda n: ({"results": [_fake_meta(f"doc{k}") for k in range(n)]}, 91)))
+
+    async def main():
+        return await asyncio.gather(M._call_llm("text a", "sn"), M._call_llm("text b", "sn"))
+
+    (r1, t1), (r2, t2) = asyncio.run(main())
+    assert calls == [("batch", 2)]
+    assert (r1["title"], r2["title"]) == ("doc0", "doc1")
+    assert (t1, t2) == (46, 45)
+
+
+def test_mismatched_batch_falls_back_to_single_requests(monkeypatch, batching):
+    calls = []
+    monkeypatch.setattr(M, "_post_llm", _recording_post(
+        calls, lambda n: ({"results": [_fake_meta("only one")]}, 40)))
+
+    async def main():
+        return await asyncio.gather(M._call_llm("text a", "sn"), M._call_llm("text b", "sn"))
+
+    (r1, t1), (r2, t2) = asyncio.run(main())
+    assert calls == [("batch", 2), "single", "single"]
+    assert (r1["title"], r2["title"]) == ("single", "single")
+    # 失败批次消耗的 tokens 计入第一篇
+    assert (t1, t2) == (50, 10)
+
+
+def test_lone_request_is_sent_alone(monkeypatch, batching):
+    monkeypatch.setattr(Config, "LLM_BATCH_WAIT", 0.01)
+    calls = []
+    monkeypatch.setattr(M, "_post_llm", _recording_post(calls, lambda n: pytest.fail("不应发送批量请求")))
+    result, tokens = asyncio.run(M._call_llm("text a", "sn"))
+    assert calls == ["single"]
+    assert (result["title"], tokens) == ("single", 10)
+
+
+def test_batching_disabled_by_default(monkeypatch):
+    calls = []
+    monkeypatch.setattr(M, "_post_llm", _recording_post(calls, lambda n: pytest.fail("不应发送批量请求")))
+    assert Config.LLM_BATCH_SIZE == 1
+    asyncio.run(M._call_llm("text a", "sn"))
+    assert calls == ["single"]
+
+
+def test_processor_path_merges_requests_and_fills_caches(monkeypatch, batching, no_cache, pdfs):
+    import concurrent_processor as cp
+    from data_processor import MetadataProcessor
+
+    calls = []
+    monkeypatch.setattr(M, "_post_llm", _recording_post(
+        calls, lambda n: ({"results": [_fake_meta(f"doc{k}") for k in range(n)]}, 80)))
+    processor = cp.ConcurrentProcessor(cp.RateLimitConfig(rps=1000, rpm=1000000, retry_attempts=1))
+    process_file = MetadataProcessor().process_file
+
+    results = asyncio.run(processor.process_batch(pdfs[:2], process_file, "ieee"))
+    assert calls == [("batch", 2)]
+    assert sorted(r["英文题目"] for r in results) == ["doc0", "doc1"]
+    assert sorted(r["tokens_used"] for r in results) == [40, 40]
+
+    # 第二次处理命中按内容哈希的结果缓存：不解析、不请求，tokens 记为 0
+    calls.clear()
+    results = asyncio.run(processor.process_batch(pdfs[:2], process_file, "ieee"))
+    assert calls == []
+    assert [r["tokens_used"] for r in results] == [0, 0]
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""LLM请求所用 HTTP 会话的生命周期测试；_post_llm 被替换，不访问网络"""
+
+import asyncio
+
+import pytest
+
+import Metadata as M
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    """记录每次请求使用的会话"""
+    used = []
+
+    async def fake_post(session, payload, headers):
+        used.append(session)
+        return {"title": "t", "authors": []}, 5
+
+    monkeypatch.setattr(M, "_post_llm", fake_post)
+    return used
+
+
+def test_other_loops_close_their_session(sessions):
+    assert asyncio.run(M.call_llm_api("text", "sn")) == ({"title": "t", "authors": []}, 5)
+    asyncio.run(M.call_llm_api_batch(["x"], "sn"))
+    # asyncio.run 的循环结束前会话已关闭，不会留下未关闭的连接器
+    assert len(sessions) == 2 and sessions[0] is not sessions[1]
+    assert all(s.closed for s in sessions)
+    assert M._SESSION is None or M._SESSION not in sessions
+
+
+def test_caller_session_is_not_closed(sessions):
+    async def main():
+        async with M._new_session() as session:
+            await M.call_llm_api("text", "sn", session)
+            return session, session.closed
+
+    session, closed_inside = asyncio.run(main())
+    assert sessions == [session]
+    assert not closed_inside
+
+
+def test_extract_many_shares_one_session(monkeypatch):
+    seen = []
+
+    async def fake_extract(path, mode, session=None):
+        seen.append(session)
+        return M._empty_meta(), 0
+
+    monkeypatch.setattr(M, "extract_first_page_llm", fake_extract)
+    asyncio.run(M.extract_many(["a.pdf", "b.pdf", "c.pdf"], "sn"))
+    assert len(seen) == 3 and seen[0] is not None
+    assert all(s is seen[0] for s in seen)
+    assert seen[0].closed
+
+
+def test_resident_loop_reuses_shared_session(sessions):
+    M.run_sync(M.call_llm_api("a", "sn"))
+    # 其它循环上的调用不会替换或关闭常驻循环上的共享会话
+    asyncio.run(M.call_llm_api("b", "sn"))
+    M.run_sync(M.call_llm_api("c", "sn"))
+    shared = sessions[0]
+    assert sessions[2] is shared and sessions[1] is not shared
+    assert not shared.closed and M._SESSION is shared
+
+    # 在其它循环上调用 close_session 不会动共享会话
+    asyncio.run(M.close_session())
+    assert not shared.closed
+    M.run_sync(M.close_session())
+    assert shared.closed and M._SESSION is None
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""会话日志的测试：后台监听线程写文件、close 标记关闭文件、退出时缓冲区落盘"""
+
+from pathlib import Path
+
+import pytest
+from flask import Flask
+
+import log_manager as lm_module
+from log_manager import LogManager
+
+_app = Flask(__name__)
+
+
+@pytest.fixture
+def manager(monkeypatch, tmp_path):
+    """日志写到临时目录；截获 atexit 注册的函数，由用例显式调用"""
+    exit_hooks = []
+    monkeypatch.setattr(lm_module.atexit, "register", exit_hooks.append)
+    manager = LogManager(str(tmp_path / "log"))
+    manager.exit_hooks = exit_hooks
+    with _app.test_request_context(environ_base={"REMOTE_ADDR": "10.0.0.7"}):
+        yield manager
+    manager.shutdown()
+    for handler in manager._router.routes.values():
+        handler.close()
+
+
+def _route(manager):
+    """按 end_upload_session 的方式取当前会话的 logger 及其文件handler"""
+    ip, session_id, _ = manager._get_ctx()
+    logger = manager._get_logger(ip, session_id)
+    return logger, manager._router.routes[logger.name]
+
+
+def test_session_report_is_written_and_file_closed(manager, tmp_path):
+    manager.start_upload_session(2, "ieee")
+    manager.log_file_upload("a.pdf", 1024)
+    manager.log_file_upload("b.pdf", 2048)
+    manager.log_file_processing("a.pdf", "ieee", 1.5, total_tokens=100)
+    manager.log_file_processing("b.pdf", "ieee", 0.5, status="error", error="LLM超时")
+    logger, handler = _route(manager)
+
+    manager.end_upload_session()
+    # 后台线程处理完队列即可，无需停止监听线程
+    manager._queue.join()
+
+    files = list((tmp_path / "log").glob("10_0_0_7_*.log"))
+    assert len(files) == 1
+    text = files[0].read_text(encoding="utf-8")
+    assert "处理模式: ieee" in text
+    assert "实际处理: 2个文件" in text
+    assert "处理失败: 1个文件" in text
+    assert "  2. b.pdf (2048 bytes)" in text
+    assert "  1. b.pdf: LLM超时" in text
+    assert "总tokens: 100" in text
+    # 写完即关闭文件并移除路由，logger 不再保留 handler
+    assert handler.stream is None
+    assert logger.name not in manager._router.routes
+    assert not logger.handlers
+    assert not manager.loggers and not manager.session_logs
+
+
+def test_buffered_info_record_is_flushed_at_exit(manager):
+    logger, handler = _route(manager)
+    logger.info("仍在缓冲区中的记录")
+    manager._queue.join()
+    path = Path(handler.baseFilename)
+    # INFO 记录只进 64KB 缓冲区，尚未落盘
+    assert path.read_bytes() == b""
+
+    assert manager.exit_hooks == [manager.shutdown]
+    for hook in manager.exit_hooks:
+        hook()
+    assert path.read_text(encoding="utf-8") == "仍在缓冲区中的记录\n"
+    assert manager._listener is None
+
+
+def test_error_record_is_flushed_immediately(manager):
+    logger, handler = _route(manager)
+    logger.info("普通记录")
+    logger.error("错误记录")
+    manager._queue.join()
+    with open(handler.baseFilename, encoding="utf-8") as f:
+        assert f.read() == "普通记录\n错误记录\n"
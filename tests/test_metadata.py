@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""Metadata 模块中作者定位相关逻辑的测试"""
+
+import copy
+import random
+from statistics import median
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pytest
+
+import Metadata
+from Metadata import _BAD_AFFIL_RE, _bind_names_to_boxes, _group_lines, _cluster_rows_by_y
+
+
+# 姓名框文本（已转小写）-> 是否应被当作单位片段跳过
+@pytest.mark.parametrize("text, is_affil", [
+    ("beihang university", True),
+    ("state key laboratory of power systems", True),
+    ("school of electrical engineering", True),
+    ("huawei technologies co.", True),
+    ("co.", True),
+    ("state grid co.,ltd", True),
+    ("state grid co., ltd", True),
+    ("state grid co.ltd", True),
+    ("state grid co ltd", True),
+    ("state grid co,ltd", True),
+    ("acme inc.", True),
+    ("xyz ltd", True),
+    ("wei co", False),
+    ("co", False),
+    ("nicolas co", False),
+    ("cohen", False),
+    ("jacob colemann", False),
+    ("fang wang", False),
+    ("label", False),
+    ("incheon kim", False),
+])
+def test_bad_affil_re(text, is_affil):
+    assert bool(_BAD_AFFIL_RE.search(text)) is is_affil
+
+
+def _box(text, cx, cy=100.0, h=10.0):
+    return {"text": text, "bbox": (cx - 20, cy - h / 2, cx + 20, cy + h / 2), "cx": cx, "cy": cy, "h": h}
+
+
+def _bound_texts(bound):
+    return [b.get("text") for b in bound]
+
+
+def test_bind_uses_optimal_not_greedy_assignment(monkeypatch):
+    # 逐个贪心：A 先拿走 X(0.9)，B 只剩 Y(0.1) 低于阈值而未绑定，总分 0.9；
+    # 全局最优：A->Y(0.8)、B->X(0.85)，两人都绑定，总分 1.65
+    sc = np.array([[0.90, 0.80],
+                   [0.85, 0.10]])
+    monkeypatch.setattr(Metadata, "_score_matrix", lambda names, texts: sc)
+    bound = _bind_names_to_boxes(["A", "B"], [_box("X", 10), _box("Y", 50)])
+    assert _bound_texts(bound) == ["Y", "X"]
+    assert [b["score"] for b in bound] == pytest.approx([0.80, 0.85])
+
+
+def test_bind_leaves_low_scoring_pairs_unbound(monkeypatch):
+    # B 的最优匹配 Y 只有 0.5，低于 0.55 的阈值；C 没有可分配的盒子
+    sc = np.array([[0.90, 0.20],
+                   [0.30, 0.50],
+                   [0.10, 0.40]])
+    monkeypatch.setattr(Metadata, "_score_matrix", lambda names, texts: sc)
+    bound = _bind_names_to_boxes(["A", "B", "C"], [_box("X", 10), _box("Y", 50)])
+    assert _bound_texts(bound) == ["X", None, None]
+    assert [b["name"] for b in bound] == ["A", "B", "C"]
+    assert bound[1]["cx"] is None and bound[1]["score"] == 0.0
+    assert bound[2]["cx"] is None and bound[2]["score"] == 0.0
+
+
+def test_bind_with_real_scores():
+    boxes = [_box("Weihao Zhang", 10), _box("Fang Wang", 50), _box("Beihang Univ", 90)]
+    bound = _bind_names_to_boxes(["Fang Wang", "Weihao Zhang", "Someone Else"], boxes)
+    assert _bound_texts(bound) == ["Fang Wang", "Weihao Zhang", None]
+    assert [b["score"] for b in bound[:2]] == pytest.approx([1.0, 1.0])
+
+
+# ---- 行分组与按行聚类：与原始纯 Python 实现逐项对照 ----
+
+def _group_lines_reference(words):
+    """原始实现：按 (block,line) 分组，行按 y0 均值排序，行内按 x0 排序"""
+    lines: Dict[Tuple[int, int], List[tuple]] = {}
+    for w in words:
+        lines.setdefault((w[5], w[6]), []).append(w)
+    ordered = []
+    for ws in lines.values():
+        ws.sort(key=lambda z: z[0])
+        ordered.append((sum(z[1] for z in ws) / len(ws), ws))
+    ordered.sort(key=lambda p: p[0])
+    return [ws for _, ws in ordered]
+
+
+def _cluster_rows_by_y_reference(bound_points: List[Dict[str, Any]]):
+    """原始实现：每加入一个点都重新计算当前行 cy 的中位数"""
+    pts = [p for p in bound_points if p["cx"] is not None]
+    if not pts:
+        return []
+    pts.sort(key=lambda x: x["cy"])
+    hs = [p["h"] for p in pts if p["h"]]
+    h_med = median(hs) if hs else 12.0
+    tau = max(h_med * 0.6, 4.0)
+    rows = []; cur = [pts[0]]; cur_cy = pts[0]["cy"]
+    for p in pts[1:]:
+        if abs(p["cy"] - cur_cy) <= tau:
+            cur.append(p); cur_cy = median([q["cy"] for q in cur])
+        else:
+            rows.append(cur); cur = [p]; cur_cy = p["cy"]
+    rows.append(cur)
+    for r in rows:
+        r.sort(key=lambda x: x["cx"])
+    rows.sort(key=lambda r: median([p["cy"] for p in r]))
+    return rows
+
+
+def _random_words(rng: random.Random) -> List[tuple]:
+    # 坐标里混入重复值，覆盖 y 均值相同、x0 相同时的稳定排序
+    words = []
+    for i in range(rng.randint(0, 40)):
+        x0 = rng.choice([rng.uniform(0, 500), 10.0, 20.0])
+        y0 = rng.choice([rng.uniform(0, 700), 100.0, 50.0])
+        words.append((x0, y0, x0 + 20, y0 + 10, f"w{i}", rng.randint(0, 3), rng.randint(0, 3), i))
+    return words
+
+
+def _random_points(rng: random.Random) -> List[Dict[str, Any]]:
+    pts = []
+    for i in range(rng.randint(0, 15)):
+        pts.append({
+            "name": f"n{i}",
+            "cx": rng.choice([None, rng.uniform(0, 500), 50.0]),
+            "cy": rng.choice([rng.uniform(0, 200), 100.0, 101.0, 105.0]),
+            "h": rng.choice([0, 8.0, 10.0, rng.uniform(5, 15)]),
+        })
+    return pts
+
+
+def _row_names(rows):
+    return [[p["name"] for p in r] for r in rows]
+
+
+def test_group_lines_matches_reference():
+    rng = random.Random(1)
+    for _ in range(1000):
+        words = _random_words(rng)
+        assert _group_lines(copy.deepcopy(words)) == _group_lines_reference(copy.deepcopy(words))
+
+
+def test_cluster_rows_by_y_matches_reference():
+    rng = random.Random(2)
+    for _ in range(1000):
+        pts = _random_points(rng)
+        assert _row_names(_cluster_rows_by_y(copy.deepcopy(pts))) == \
+            _row_names(_cluster_rows_by_y_reference(copy.deepcopy(pts)))
+
+
+def test_group_lines_two_column_fixture():
+    # 右栏第 0 行与左栏第 0 行同高，y 均值相同时按行首次出现的顺序
+    words = [
+        (300, 100, 340, 110, "Cheng", 1, 0, 0), (350, 100, 380, 110, "Gao", 1, 0, 1),
+        (50, 101, 90, 111, "Wang", 0, 0, 1), (10, 99, 45, 109, "Fang", 0, 0, 0),
+        (10, 130, 60, 140, "Weihao", 0, 1, 0), (65, 130, 100, 140, "Zhang", 0, 1, 1),
+    ]
+    lines = _group_lines(words)
+    assert [[w[4] for w in ln] for ln in lines] == [["Cheng", "Gao"], ["Fang", "Wang"], ["Weihao", "Zhang"]]
+    assert lines == _group_lines_reference(words)
+
+
+def test_cluster_rows_by_y_fixture():
+    pts = [
+        {"name": "C", "cx": 300.0, "cy": 102.0, "h": 10.0},
+        {"name": "A", "cx": 50.0, "cy": 100.0, "h": 10.0},
+        {"name": "skip", "cx": None, "cy": 100.0, "h": 10.0},
+        {"name": "D", "cx": 40.0, "cy": 140.0, "h": 10.0},
+        {"name": "B", "cx": 150.0, "cy": 105.0, "h": 10.0},
+    ]
+    # tau = max(10*0.6, 4) = 6：A、C、B 同一行（行内按 cx），D 另起一行；未绑定的点被忽略
+    assert _row_names(_cluster_rows_by_y(pts)) == [["A", "B", "C"], ["D"]]
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""提取结果缓存的测试：内存 LRU 缓存与持久化 JSONL 缓存"""
+
+import asyncio
+import os
+from collections import OrderedDict
+
+import orjson
+import pytest
+
+import Metadata as M
+from config import Config
+from Metadata import Affiliation, Author, PaperMeta
+
+SAMPLE_PDF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample.pdf")
+
+
+def _meta(title: str = "Power Inspection") -> PaperMeta:
+    return PaperMeta(
+        title=title,
+        abstract="abs",
+        keywords=["uav", "pso"],
+        authors=[Author(order=1, name="Fang Wang", superscripts=["1"], affiliation_ids=["1"],
+                        email="fw@buaa.edu.cn", is_first_author=True, is_corresponding_author=True)],
+        affiliations=[Affiliation(id="1", name="Beihang University", raw="1 Beihang University")],
+        emails=["fw@buaa.edu.cn"],
+        confidence=0.9,
+    )
+
+
+@pytest.fixture
+def disk_cache(monkeypatch, tmp_path):
+    """把持久化缓存指向临时文件，并重置模块内的缓存状态"""
+    path = tmp_path / "cache" / "meta.jsonl"
+    monkeypatch.setattr(Config, "META_CACHE_FILE", str(path))
+    monkeypatch.setattr(Config, "META_CACHE_FILE_SIZE", 3)
+    monkeypatch.setattr(M, "_DISK_CACHE", None)
+    monkeypatch.setattr(M, "_DISK_CACHE_LINES", 0)
+    M._disk_cache_version.cache_clear()
+    yield path
+    M._disk_cache_version.cache_clear()
+
+
+def _reload(monkeypatch):
+    """模拟进程重启：丢弃内存中的条目，下次访问时重新读文件"""
+    monkeypatch.setattr(M, "_DISK_CACHE", None)
+
+
+def _lines(path):
+    return path.read_bytes().splitlines()
+
+
+def test_round_trip_rebuilds_paper_meta(monkeypatch, disk_cache):
+    meta = _meta()
+    M._disk_cache_put(("d1", "sn"), meta, 123)
+    _reload(monkeypatch)
+    hit = M._disk_cache_get(("d1", "sn"))
+    assert hit is not None
+    restored, tokens = hit
+    assert tokens == 123
+    assert restored == meta
+    assert isinstance(restored.authors[0], Author)
+    assert isinstance(restored.affiliations[0], Affiliation)
+    # 其它模式、其它文件不命中
+    assert M._disk_cache_get(("d1", "ap")) is None
+    assert M._disk_cache_get(("d2", "sn")) is None
+
+
+@pytest.mark.parametrize("change", ["model", "prompt", "schema"])
+def test_model_prompt_or_schema_change_misses(monkeypatch, disk_cache, change):
+    M._disk_cache_put(("d1", "sn"), _meta(), 1)
+    assert M._disk_cache_get(("d1", "sn")) is not None
+
+    if change == "model":
+        monkeypatch.setattr(Config, "LLM_MODEL", "another-model")
+    elif change == "prompt":
+        monkeypatch.setattr(M.PromptsConfig, "get_prompt_parts", classmethod(lambda cls, mode: ("new ", " prompt")))
+    else:
+        monkeypatch.setattr(M, "_DISK_CACHE_SCHEMA", M._DISK_CACHE_SCHEMA + 1)
+    M._disk_cache_version.cache_clear()
+    assert M._disk_cache_get(("d1", "sn")) is None
+    # 旧记录仍在文件里，只是不再被命中
+    assert len(_lines(disk_cache)) == 1
+
+
+def test_eviction_keeps_most_recent_entries(monkeypatch, disk_cache):
+    for i in range(3):
+        M._disk_cache_put((f"d{i}", "sn"), _meta(f"t{i}"), i)
+    # 读取 d0 刷新其最近使用顺序，随后写入 d3 应淘汰 d1
+    assert M._disk_cache_get(("d0", "sn")) is not None
+    M._disk_cache_put(("d3", "sn"), _meta("t3"), 3)
+    assert len(M._DISK_CACHE) == 3
+    assert M._disk_cache_get(("d1", "sn")) is None
+    assert {M._disk_cache_get((f"d{i}", "sn"))[1] for i in (0, 2, 3)} == {0, 2, 3}
+
+
+def test_compaction_when_file_exceeds_twice_the_size(monkeypatch, disk_cache):
+    for i in range(6):
+        M._disk_cache_put((f"d{i}", "sn"), _meta(f"t{i}"), i)
+    # 6 行 = 2 × 3，尚未超过阈值，只追加
+    assert len(_lines(disk_cache)) == 6
+    M._disk_cache_put(("d6", "sn"), _meta("t6"), 6)
+    # 第 7 行超过阈值：按内存中保留的 3 条重写
+    assert len(_lines(disk_cache)) == 3
+    assert M._DISK_CACHE_LINES == 3
+    _reload(monkeypatch)
+    assert [M._disk_cache_get((f"d{i}", "sn"))[1] for i in (4, 5, 6)] == [4, 5, 6]
+    assert M._disk_cache_get(("d3", "sn")) is None
+
+
+def test_load_compacts_duplicates_and_skips_corrupt_lines(monkeypatch, disk_cache):
+    M._disk_cache_put(("d1", "sn"), _meta("old"), 1)
+    M._disk_cache_put(("d1", "sn"), _meta("new"), 2)
+    with open(disk_cache, "ab") as f:
+        f.write(b"{not json\n")
+        f.write(orjson.dumps({"no_key": 1}) + b"\n")
+        f.write(b"\n")
+    M._disk_cache_put(("d2", "sn"), _meta("second"), 3)
+
+    _reload(monkeypatch)
+    hit = M._disk_cache_get(("d1", "sn"))
+    assert hit[0].title == "new" and hit[1] == 2
+    assert M._disk_cache_get(("d2", "sn"))[0].title == "second"
+    # 加载时发现重复与损坏的行，文件被压缩为有效的 2 行
+    assert len(_lines(disk_cache)) == 2
+
+
+def test_record_with_stale_fields_is_a_miss(monkeypatch, disk_cache):
+    key = M._disk_cache_key(("d1", "sn"))
+    disk_cache.parent.mkdir(parents=True)
+    bad = {"title": "x", "authors": [{"name": "a", "unknown_field": 1}]}
+    disk_cache.write_bytes(orjson.dumps({"k": key, "v": bad, "t": 1}) + b"\n")
+    assert M._disk_cache_get(("d1", "sn")) is None
+
+
+def test_empty_path_disables_disk_cache(monkeypatch, disk_cache):
+    monkeypatch.setattr(Config, "META_CACHE_FILE", "")
+    M._disk_cache_put(("d1", "sn"), _meta(), 1)
+    assert M._disk_cache_get(("d1", "sn")) is None
+    assert M._DISK_CACHE is None
+    assert not disk_cache.exists()
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = OrderedDict()
+    for k in "abc":
+        M._cache_put(cache, k, k.upper(), 3)
+    # 读取 a 刷新顺序，写入 d 应淘汰 b
+    assert M._cache_get(cache, "a") == "A"
+    M._cache_put(cache, "d", "D", 3)
+    assert list(cache) == ["c", "a", "d"]
+    assert M._cache_get(cache, "b") is None
+    # 大小为 0 时写入后立即淘汰
+    M._cache_put(cache, "e", "E", 0)
+    assert not cache
+
+
+@pytest.fixture
+def memory_cache(monkeypatch):
+    """只用内存缓存，并清空模块内已有的条目"""
+    monkeypatch.setattr(Config, "META_CACHE_FILE", "")
+    caches = (M._META_CACHE, M._CTX_CACHE, M._LLM_CACHE)
+    for c in caches:
+        c.clear()
+    yield
+    for c in caches:
+        c.clear()
+
+
+def _counting_post(calls):
+    async def fake_post(session, payload, headers):
+        calls.append(payload)
+        return {"title": "Power Inspection", "authors": [{"name": "Fang Wang", "order": 1}],
+                "keywords": ["uav"]}, 30
+    return fake_post
+
+
+def test_memory_hit_returns_independent_copy(monkeypatch, memory_cache):
+    calls = []
+    monkeypatch.setattr(M, "_post_llm", _counting_post(calls))
+
+    meta, tokens = asyncio.run(M.extract_first_page_llm(SAMPLE_PDF, "sn"))
+    assert (meta.title, tokens) == ("Power Inspection", 30)
+    assert len(M._META_CACHE) == 1 and len(M._CTX_CACHE) == 1
+    # 调用方原地修改返回结果，不应影响缓存中的条目
+    meta.title = "changed"
+    meta.authors.clear()
+    meta.keywords.append("x")
+
+    hit, tokens = asyncio.run(M.extract_first_page_llm(SAMPLE_PDF, "sn"))
+    assert len(calls) == 1
+    assert (hit.title, tokens) == ("Power Inspection", 0)
+    assert [a.name for a in hit.authors] == ["Fang Wang"]
+    assert hit.keywords == ["uav"]
+    # 其它模式使用不同的 key
+    assert M._cache_get(M._META_CACHE, (M._file_digest(SAMPLE_PDF), "ap")) is None
+
+
+def test_cache_disabled_skips_file_digest(monkeypatch, memory_cache):
+    calls = []
+    monkeypatch.setattr(M, "_post_llm", _counting_post(calls))
+    monkeypatch.setattr(Config, "META_CACHE_SIZE", 0)
+
+    def no_digest(path):
+        raise AssertionError("缓存关闭时不应计算文件哈希")
+
+    monkeypatch.setattr(M, "_file_digest", no_digest)
+    for _ in range(2):
+        meta, tokens = asyncio.run(M.extract_first_page_llm(SAMPLE_PDF, "sn"))
+        assert (meta.title, tokens) == ("Power Inspection", 30)
+    assert len(calls) == 2
+    assert not M._META_CACHE and not M._CTX_CACHE and not M._LLM_CACHE